@@ -0,0 +1,58 @@
+""" Compare `Schema.from_json_bytes` with `json.loads` followed by `Schema`
+on JSON documents with a few validated fields and a large unvalidated blob.
+
+Run: ::
+
+    python benchmarks/json_projection.py
+"""
+import os
+import sys
+import json
+import timeit
+
+# Run from a checkout, without installing the package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from yasv import Schema, Field, Required, length
+
+
+class UserSchema(Schema):
+    name = Field('Name', Required(), length(max=20))
+    email = Field('Email', Required())
+
+
+def document(blob):
+    return json.dumps({'name': 'George', 'blob': blob,
+                       'email': 'george@example.com'}).encode('utf-8')
+
+
+CASES = [
+    ('2,000 small objects', document(
+        [{'id': i, 'tag': 'item {0}'.format(i), 'ok': i % 2 == 0}
+         for i in range(2000)])),
+    ('one 200 KB string', document('x' * 200000)),
+    ('200 KB escaped string', document('a"\\b\n' * 40000)),
+    ('20,000 numbers', document([i * 1.5 for i in range(20000)])),
+    ('nested lists of numbers', document(
+        [[i, i + 1, [i * 2]] for i in range(5000)])),
+    ('5,000 short strings', document(
+        ['value {0}'.format(i) for i in range(5000)])),
+]
+
+
+def main(number=50):
+    print('{0:<26} {1:>9} {2:>9} {3:>7}'.format(
+        'blob', 'loads ms', 'scan ms', 'ratio'))
+    for name, buf in CASES:
+        loads = timeit.timeit(lambda: UserSchema(json.loads(buf)).is_valid,
+                              number=number) / number * 1000
+        scan = timeit.timeit(
+            lambda: UserSchema.from_json_bytes(buf).is_valid,
+            number=number) / number * 1000
+        print('{0:<26} {1:>9.3f} {2:>9.3f} {3:>6.2f}x'.format(
+            name, loads, scan, scan / loads))
+
+
+if __name__ == '__main__':
+    main()
@@ -74,4 +74,7 @@ setup(
     classifiers=classifiers,
     packages=['yasv'],
     install_requires=install_requires,
+    entry_points={
+        'console_scripts': ['yasv = yasv.server:main'],
+    },
 )
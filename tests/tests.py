@@ -1,7 +1,25 @@
+import sys
 import unittest
 from collections import namedtuple
 
 from yasv import *
+from yasv.client import Client
+from yasv.server import Server, load_schema
+
+
+class ServerSchema(Schema):
+    foo = Field('Foo', Required())
+    bar = Field('Bar', is_in([1, 2]))
+
+
+class GreekValidator(Validator):
+
+    def on_value(self):
+        return self.value in {'alpha', 'beta', 'gamma', 'delta', 'epsilon'}
+
+
+class GreekSchema(Schema):
+    letter = Field('Letter', GreekValidator(), is_in({'alpha', 'beta'}))
 
 
 class TestSchema(unittest.TestCase):
@@ -63,6 +81,29 @@ class TestSchema(unittest.TestCase):
         s.is_valid
         self.assertEqual(s.get_errors(), {'foo': ['Value is required.']})
 
+    def test_custom_template(self):
+        class Positive(Validator):
+            def on_value(self):
+                if self.value > 0:
+                    return True
+                self.message('default', self.value)
+                return False
+
+        class TestSchema(Schema):
+            foo = Field('Foo', IsIn('Pick one of {0}.')([1]))
+            bar = Field('Bar', is_in([1]))
+            baz = Field('Baz', Positive('Not positive: {0}.'))
+
+        s = TestSchema({'foo': 2, 'bar': 2, 'baz': -1})
+        self.assertEqual(s.get_errors(), {
+            'foo': ['Pick one of [1].'],
+            'bar': ['Value have to be in: ([1]).'],
+            'baz': ['Not positive: -1.'],
+        })
+        self.assertEqual(IsIn.templates,
+                         {'default': 'Value have to be in: ({0}).'})
+        self.assertEqual(Validator.templates, {})
+
     def test_is_url(self):
         class TestSchema(Schema):
             url = Field('URL', IsURL())
@@ -135,6 +176,918 @@ class TestSchema(unittest.TestCase):
         s = TestSchema({'foo': 1})
         self.assertEqual(s.is_valid, False)
 
+    def test_rebind(self):
+        class TestSchema(Schema):
+            foo = Field('Foo', Required())
+            bar = Field('Bar', is_in([1, 2]))
+
+        s = TestSchema({'foo': 1, 'bar': 3})
+        self.assertEqual(s.is_valid, False)
+        fields = dict(s.items())
+
+        s.rebind({'foo': 1, 'bar': 2})
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s.get_errors(), {})
+        self.assertEqual(s['bar'].raw_data, 2)
+        self.assertEqual(dict(s.items()), fields)
+
+        s.rebind({'bar': 1})
+        self.assertEqual(s['foo'].raw_data, None)
+        self.assertEqual(s.get_errors(), {'foo': ['Value is required.']})
+
+    def test_pool(self):
+        import threading
+
+        class TestSchema(Schema):
+            foo = Field('Foo', Required())
+
+        s = TestSchema.acquire({'foo': 1})
+        self.assertEqual(s.is_valid, True)
+        s.release()
+        self.assertIs(TestSchema.acquire({}), s)
+        self.assertEqual(s.is_valid, False)
+        s.release()
+
+        # Pools are per thread.
+        other = []
+        t = threading.Thread(
+            target=lambda: other.append(TestSchema.acquire({'foo': 1})))
+        t.start()
+        t.join()
+        self.assertIsNot(other[0], s)
+
+        # Pooled instances have own validators.
+        self.assertIsNot(s['foo'].validators[0],
+                         TestSchema({})['foo'].validators[0])
+
+        # Instances are not reused after fields of the schema were changed.
+        TestSchema.bar = Field('Bar')
+        s2 = TestSchema.acquire({'foo': 1, 'bar': 2})
+        self.assertIsNot(s2, s)
+        self.assertEqual(s2['bar'].raw_data, 2)
+
+        # Released instances do not keep the data.
+        s2.release()
+        self.assertEqual(s2['bar'].raw_data, None)
+        self.assertEqual(s2['bar']._cleaned_data, None)
+        s3 = TestSchema.acquire({'foo': 1})
+        self.assertIs(s3, s2)
+        self.assertEqual((s3['foo'].raw_data, s3['bar'].raw_data), (1, None))
+        self.assertEqual(s3.is_valid, True)
+
+    def test_pool_threads(self):
+        import threading
+
+        class TestSchema(Schema):
+            foo = Field('Foo', Required(), length(min=2, max=4),
+                        all_of(not_(is_in(['abc']))))
+
+        # Switch threads as often as possible.
+        if hasattr(sys, 'setswitchinterval'):
+            self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+            sys.setswitchinterval(1e-6)
+        else:
+            self.addCleanup(sys.setcheckinterval, sys.getcheckinterval())
+            sys.setcheckinterval(1)
+        wrong = []
+
+        def validate(offset):
+            for i in range(3000):
+                value = ['ab', 'abcdef', 'abc'][(i + offset) % 3]
+                s = TestSchema.acquire({'foo': value})
+                if s.is_valid != (value == 'ab'):
+                    wrong.append(value)
+                s.release()
+
+        threads = [threading.Thread(target=validate, args=(i, ))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(wrong, [])
+
+    def test_all_of(self):
+        calls = []
+
+        class CountedString(String):
+            def specified_type(self):
+                calls.append(self.value)
+                return super(CountedString, self).specified_type()
+
+        class CountedURL(IsURL, CountedString):
+            pass
+
+        validator = all_of(CountedString(), length(min=2), CountedURL(),
+                           length(min=2))
+        self.assertEqual(len(validator.validators), 3)
+
+        class TestSchema(Schema):
+            url = Field('URL', validator)
+
+        s = TestSchema({'url': 'http://example.com'})
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(calls, ['http://example.com'])
+
+        s = TestSchema({'url': 3})
+        self.assertEqual(s.is_valid, False)
+        self.assertEqual(s.get_errors(),
+                         {'url': ['Illegal type. String expected: int.']})
+
+        s = TestSchema({'url': 'x'})
+        self.assertEqual(s.get_errors(), {'url': [
+            'Length must be between 2 and {0}.'.format(sys.maxsize)]})
+
+        s = TestSchema({'url': 'www.example.com'})
+        self.assertEqual(s.get_errors(), {'url': ['Invalid URL.']})
+
+        # Errors of the chain are reported, when a reordered check fails
+        # without an error.
+        class TestSchema(Schema):
+            foo = Field('Foo', all_of(is_in(['a']), IsURL()))
+            bar = Field('Bar', all_of(is_in(['a']), length(max=2)))
+
+        self.assertEqual(TestSchema({'foo': None, 'bar': None}).get_errors(),
+                         {'foo': ["Value have to be in: (['a'])."],
+                          'bar': ["Value have to be in: (['a'])."]})
+
+    def test_all_of_parameters(self):
+        class IsInstance(Validator):
+            def specified_type(self):
+                return isinstance(self.value, self.type)
+
+            def __call__(self, type):
+                return self.context(type=type)
+
+        is_instance = IsInstance()
+
+        class TestSchema(Schema):
+            foo = Field('Foo', all_of(is_instance(int), is_instance(bool)))
+
+        self.assertEqual(TestSchema({'foo': True}).is_valid, True)
+        self.assertEqual(TestSchema({'foo': 5}).is_valid, False)
+
+        validator = all_of(is_instance(int), is_instance(int))
+        self.assertEqual(len(validator.validators), 1)
+
+    def test_all_of_opaque(self):
+        class Strip(Validator):
+            opaque = True
+
+            def on_value(self):
+                self.value = self.value.strip()
+                return True
+
+        class TestSchema(Schema):
+            foo = Field('Foo', all_of(Strip(), Required(), length(max=2)))
+
+        s = TestSchema({'foo': '  ab  '})
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['foo'].cleaned_data, 'ab')
+        self.assertEqual(TestSchema({'foo': '   '}).get_errors(),
+                         {'foo': ['Value is required.']})
+
+        class Upper(Validator):
+            def apply_rules(self):
+                self.field._cleaned_data = self.value.upper()
+                return True
+
+        class TestSchema(Schema):
+            foo = Field('Foo', all_of(Upper(), length(max=2)))
+
+        s = TestSchema({'foo': 'ab'})
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['foo'].cleaned_data, 'AB')
+
+    def test_any_of(self):
+        class TestSchema(Schema):
+            foo = Field('Foo', any_of(is_in([1, 2]), length(min=2)))
+
+        self.assertEqual(TestSchema({'foo': 1}).is_valid, True)
+        self.assertEqual(TestSchema({'foo': 'ab'}).is_valid, True)
+
+        s = TestSchema({'foo': 'a'})
+        self.assertEqual(s.is_valid, False)
+        self.assertEqual(s.get_errors(), {'foo': [
+            'Length must be between 2 and {0}.'.format(sys.maxsize)]})
+
+    def test_not(self):
+        class TestSchema(Schema):
+            foo = Field('Foo', not_(is_in([1, 2])))
+
+        self.assertEqual(TestSchema({'foo': 3}).is_valid, True)
+
+        s = TestSchema({'foo': 1})
+        self.assertEqual(s.is_valid, False)
+        self.assertEqual(s.get_errors(), {'foo': ['Value is not allowed.']})
+
+    def test_when(self):
+        class TestSchema(Schema):
+            kind = Field('Kind')
+            url = Field('URL', when(lambda value, schema:
+                                    schema['kind'].raw_data == 'link',
+                                    Required(), IsURL()))
+            name = Field('Name', when(is_in(['a', 'b']), length(max=1)))
+
+        s = TestSchema({'kind': 'link', 'url': 'http://example.com'})
+        self.assertEqual(s.is_valid, True)
+
+        s = TestSchema({'kind': 'text'})
+        self.assertEqual(s.is_valid, True)
+
+        s = TestSchema({'kind': 'link'})
+        self.assertEqual(s.get_errors(), {'url': ['Value is required.']})
+
+        s = TestSchema({'name': 'abc'})
+        self.assertEqual(s.is_valid, True)
+
+    def test_coerce(self):
+        import uuid
+        import decimal
+        import datetime
+
+        class TestSchema(Schema):
+            count = Field('Count', Int(), in_range(min=1, max=10))
+            price = Field('Price', Float())
+            amount = Field('Amount', Decimal())
+            created = Field('Created', DateTime(cache=2))
+            day = Field('Day', DateTime(format='%d.%m.%Y'))
+            id = Field('ID', UUID())
+
+        s = TestSchema({
+            'count': '5',
+            'price': '1.5',
+            'amount': '0.1',
+            'created': '2014-01-02T03:04:05',
+            'day': '02.01.2014',
+            'id': '12345678-1234-5678-1234-567812345678',
+        })
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['count'].cleaned_data, 5)
+        self.assertEqual(s['count'].raw_data, '5')
+        self.assertEqual(s['price'].cleaned_data, 1.5)
+        self.assertEqual(s['amount'].cleaned_data, decimal.Decimal('0.1'))
+        self.assertEqual(s['created'].cleaned_data,
+                         datetime.datetime(2014, 1, 2, 3, 4, 5))
+        self.assertEqual(s['day'].cleaned_data, datetime.datetime(2014, 1, 2))
+        self.assertEqual(s['id'].cleaned_data,
+                         uuid.UUID('12345678-1234-5678-1234-567812345678'))
+
+        s = TestSchema({'count': '50', 'price': 2, 'amount': 0.1,
+                        'created': 'x', 'day': 'y', 'id': 1})
+        self.assertEqual(s.is_valid, False)
+        self.assertEqual(s['price'].cleaned_data, 2.0)
+        self.assertEqual(s['amount'].cleaned_data, decimal.Decimal('0.1'))
+        self.assertEqual(s.get_errors(), {
+            'count': ['Value must be between 1 and 10.'],
+            'created': ['Illegal value. Datetime expected: x.'],
+            'day': ['Illegal value. Datetime expected: y.'],
+            'id': ['Illegal value. UUID expected: 1.'],
+        })
+
+        s = TestSchema({'count': True, 'price': 'a', 'amount': 'b'})
+        self.assertEqual(s.get_errors()['count'],
+                         ['Illegal value. Integer expected: True.'])
+        self.assertEqual(s.get_errors()['price'],
+                         ['Illegal value. Float expected: a.'])
+        self.assertEqual(s.get_errors()['amount'],
+                         ['Illegal value. Decimal expected: b.'])
+
+    def test_coerce_finite(self):
+        import decimal
+
+        class TestSchema(Schema):
+            price = Field('Price', Float())
+            amount = Field('Amount', Decimal(), in_range(min=0, max=10))
+
+        for price, amount in [('nan', 'NaN'), ('inf', 'sNaN'),
+                              (float('-inf'), '-Infinity'),
+                              (float('nan'), decimal.Decimal('NaN'))]:
+            s = TestSchema({'price': price, 'amount': amount})
+            self.assertEqual(s.is_valid, False)
+            self.assertEqual(s.get_errors(), {
+                'price': ['Illegal value. Float expected: {0}.'.format(price)],
+                'amount': ['Illegal value. Decimal expected: {0}.'.format(
+                    amount)],
+            })
+
+        class TestSchema(Schema):
+            price = Field('Price', Float(finite=False))
+            amount = Field('Amount', Decimal(finite=False))
+
+        s = TestSchema({'price': 'inf', 'amount': 'NaN'})
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['price'].cleaned_data, float('inf'))
+        self.assertTrue(s['amount'].cleaned_data.is_nan())
+
+    def test_coerce_cache(self):
+        validator = Int(cache=2)
+
+        class TestSchema(Schema):
+            count = Field('Count', validator)
+
+        for value in ['1', '2', '1', 'x', '3']:
+            TestSchema({'count': value}).is_valid
+            self.assertTrue(len(validator._cache) <= 2)
+        self.assertEqual(TestSchema({'count': '3'})['count'].cleaned_data, 3)
+        self.assertEqual(TestSchema({'count': 'x'}).is_valid, False)
+
+    def test_coerce_all_of(self):
+        class TestSchema(Schema):
+            count = Field('Count', all_of(Required(), Int(),
+                                          in_range(min=1, max=10)))
+
+        s = TestSchema({'count': '5'})
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['count'].cleaned_data, 5)
+        self.assertEqual(TestSchema({'count': '50'}).is_valid, False)
+
+    def test_pattern_set(self):
+        validator = PatternSet([
+            ('de', r'DE[0-9]{9}$'),
+            ('at', r'ATU[0-9]{8}$'),
+            ('dk', r'DK[0-9]{8}$'),
+            ('digits', r'[0-9]+$'),
+            ('any', r'(X|Y)-[0-9]+$'),
+        ])
+
+        class TestSchema(Schema):
+            vat = Field('VAT', validator)
+
+        s = TestSchema({'vat': 'de123456789'})
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['vat'].matched, 'de')
+
+        self.assertEqual(validator.match('ATU12345678'), 'at')
+        self.assertEqual(validator.match('DK12345678'), 'dk')
+        self.assertEqual(validator.match('12345'), 'digits')
+        self.assertEqual(validator.match('Y-1'), 'any')
+        self.assertEqual(validator.match('DE1'), None)
+        self.assertEqual(validator.match('FR1'), None)
+
+        s = TestSchema({'vat': 'DE1'})
+        self.assertEqual(s.is_valid, False)
+        self.assertEqual(s.get_errors(), {
+            'vat': ['Value does not match any of allowed patterns.']})
+
+        s = TestSchema({'vat': 1})
+        self.assertEqual(s.get_errors(), {
+            'vat': ['Illegal type. String expected: int.']})
+
+        # Matched patterns are reported per field and reset on rebind.
+        class TwoFieldSchema(Schema):
+            a = Field('A', validator)
+            b = Field('B', validator)
+
+        s = TwoFieldSchema({'a': 'DE123456789', 'b': '123'})
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['a'].matched, 'de')
+        self.assertEqual(s['b'].matched, 'digits')
+
+        s.rebind({'a': '', 'b': 'X-1'})
+        self.assertEqual(s['a'].matched, None)
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['a'].matched, None)
+        self.assertEqual(s['b'].matched, 'any')
+
+        validator = PatternSet({'host': r'example\.com$'}, flags=0)
+        self.assertEqual(validator.match('example.com'), 'host')
+        self.assertEqual(validator.match('EXAMPLE.com'), None)
+
+        validator = PatternSet([('i', u'istanbul$')])
+        self.assertEqual(validator.match(u'\u0130stanbul'), 'i')
+        self.assertRaises(ValueError, PatternSet, [('a', '(?i)abc')])
+        validator = PatternSet([('a', '(?i:abc)'), ('b', 'b')], flags=0)
+        self.assertEqual(validator.match('ABC'), 'a')
+
+    def test_from_json_bytes(self):
+        class TestSchema(Schema):
+            foo = Field('Foo', Required())
+            bar = Field('Bar', is_in([1, 2]))
+
+        buf = (b'{"blob": {"a": [1, "]}\\"", {"b": null}], "c": "{"},'
+               b' "foo": "\\u0066oo", "n": -1.5e3, "t": true,'
+               b' "bar": 2, "list": [[], {}]}')
+        s = TestSchema.from_json_bytes(buf)
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['foo'].raw_data, 'foo')
+        self.assertEqual(s['bar'].raw_data, 2)
+
+        s = TestSchema.from_json_bytes(memoryview(b' { "bar" : 3 } '))
+        self.assertEqual(s.get_errors(), {
+            'foo': ['Value is required.'],
+            'bar': ['Value have to be in: ([1, 2]).'],
+        })
+        self.assertEqual(TestSchema.from_json_bytes(b'{}').is_valid, False)
+
+        for buf in [b'{"a": nope, "foo": 1}', b'{"a": [1, nope], "foo": 1}',
+                    b'{"a": tru, "foo": 1}', b'{"a": 01, "foo": 1}',
+                    b'{"a": [1, "x" 2], "foo": 1}']:
+            self.assertRaises(ValueError, TestSchema.from_json_bytes, buf)
+
+        buf = (b'{"a": "x\\"y", "b": [1, [2, [3, [4, [5, [6]]]]]],'
+               b' "c": [1, "]"], "d": [true, null, -1e3], "foo": 1}')
+        s = TestSchema.from_json_bytes(buf)
+        self.assertEqual(s['foo'].raw_data, 1)
+
+        for buf in [b'[]', b'{"foo": 1', b'{"foo" 1}', b'{"a": [1}',
+                    b'{"a": "1', b'{"a": "1\\"}', b'{"a": [[1]}',
+                    b'{"a": "1}', b'{"foo": 1} 2', b'{"foo": 1,}']:
+            self.assertRaises(ValueError, TestSchema.from_json_bytes, buf)
+
+    def test_validate_many(self):
+        results = ServerSchema.validate_many([
+            {'foo': 1, 'bar': 1}, {'bar': 3}, {'foo': 1}])
+        self.assertEqual(results, [
+            (True, {}),
+            (False, {'foo': ['Value is required.'],
+                     'bar': ['Value have to be in: ([1, 2]).']}),
+            (False, {'bar': ['Value have to be in: ([1, 2]).']}),
+        ])
+        self.assertEqual(ServerSchema.validate_many([]), [])
+
+    def test_projection(self):
+        class PriceValidator(Validator):
+
+            def on_value(self):
+                self.fields['type'].cleaned_data = (
+                    'volleyball' if self.value > 10 else 'football')
+                return True
+
+        class BallSchema(Schema):
+            price = Field(PriceValidator(), depends=['type'])
+            type = Field()
+            name = Field(Required())
+            size = Field(in_range(min=1, max=5))
+
+        data = {'price': 20, 'type': 'basketball', 'size': 10}
+        s = BallSchema(data, only=['price'])
+        self.assertEqual(sorted(s), ['price', 'type'])
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['type'].cleaned_data, 'volleyball')
+
+        s = BallSchema(data, exclude=['name', 'type'])
+        self.assertEqual(sorted(s), ['price', 'size', 'type'])
+        self.assertEqual(s.get_errors(),
+                         {'size': ['Value must be between 1 and 5.']})
+
+        s = BallSchema(data, only=['name'], exclude=['name'])
+        self.assertEqual(list(s), [])
+        self.assertEqual(s.is_valid, True)
+
+        # Projections are cached per class and set of names.
+        self.assertIs(BallSchema(data, only=['price'])._bound_fields,
+                      BallSchema(data, only=('price', 'price'))._bound_fields)
+        self.assertRaises(ValueError, BallSchema, data, only=['missing'])
+
+        s = BallSchema.acquire(data, only=['size'])
+        self.assertEqual(list(s), ['size'])
+        s.release()
+        self.assertIsNot(BallSchema.acquire(data), s)
+        self.assertIs(BallSchema.acquire({'size': 2}, only=['size']), s)
+        self.assertEqual(s.is_valid, True)
+
+        self.assertEqual(BallSchema.validate_many([data], only=['name']),
+                         [(False, {'name': ['Value is required.']})])
+        s = BallSchema.from_json_bytes(b'{"size": 3, "name": ""}',
+                                       only=['size'])
+        self.assertEqual(s.is_valid, True)
+        self.assertEqual(s['size'].raw_data, 3)
+
+    def test_outputs(self):
+        class TestSchema(Schema):
+            name = Field(Required())
+            count = Field(Int())
+
+        s = TestSchema({'name': 'a', 'count': '1'})
+        record = s.as_record()
+        self.assertEqual((record.name, record.count), ('a', 1))
+        self.assertEqual(list(record), [1, 'a'])
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual(repr(record), "TestSchemaRecord(count=1, name='a')")
+        self.assertIs(record.__class__, TestSchema.record_class())
+        self.assertEqual(s.as_tuple(), TestSchema.tuple_class()(1, 'a'))
+        self.assertEqual(s.as_tuple()._fields, ('count', 'name'))
+        self.assertEqual(TestSchema({'count': '1'}).as_record(), None)
+        self.assertEqual(TestSchema({'count': 3}, only=['count']).as_tuple(),
+                         (3, ))
+
+        records = [{'name': 'a', 'count': '1'}, {'count': 'x'},
+                   {'name': 'b', 'count': 2}]
+        cleaned, errors = TestSchema.clean_many(records)
+        Record = TestSchema.record_class()
+        self.assertEqual(cleaned, [Record(1, 'a'), Record(2, 'b')])
+        self.assertEqual(errors, {1: {
+            'name': ['Value is required.'],
+            'count': ['Illegal value. Integer expected: x.']}})
+
+        cleaned, _ = TestSchema.clean_many(records, output='tuple')
+        self.assertEqual(cleaned, [(1, 'a'), (2, 'b')])
+        cleaned, _ = TestSchema.clean_many(records, output='columns')
+        self.assertEqual(cleaned, {'count': [1, 2], 'name': ['a', 'b']})
+        cleaned, _ = TestSchema.clean_many(records, output='columns',
+                                           only=['name'])
+        self.assertEqual(cleaned, {'name': ['a', 'b']})
+        self.assertRaises(ValueError, TestSchema.clean_many, records, 'x')
+
+    def test_output_pickle(self):
+        import pickle
+
+        s = ServerSchema({'foo': 1, 'bar': 2})
+        outputs = [s.as_record(), s.as_tuple(),
+                   ServerSchema({'foo': 1}, only=['foo']).as_record()]
+        for output in outputs:
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                copy = pickle.loads(pickle.dumps(output, protocol))
+                self.assertIs(copy.__class__, output.__class__)
+                self.assertEqual(copy, output)
+
+    def test_record_class(self):
+        from yasv.records import record_class
+
+        class SelfSchema(Schema):
+            self = Field(Required())
+            other = Field()
+
+        record = SelfSchema({'self': 1, 'other': 2}).as_record()
+        self.assertEqual((record.self, record.other), (1, 2))
+        self.assertEqual(SelfSchema({'self': 1}).as_tuple().self, 1)
+
+        for names in [['a-b'], ['1a'], ['_a'], ['class'], ['a', 'a'], ['']]:
+            self.assertRaises(ValueError, record_class, 'Record', names)
+
+
+class TestAllocationProfiler(unittest.TestCase):
+
+    def test_profiler(self):
+        import os
+        import json
+        import tempfile
+        from yasv.profiling import AllocationProfiler, compare, tracemalloc
+
+        class TestSchema(Schema):
+            foo = Field('Foo', Required())
+            bar = Field('Bar', Int())
+
+        validate = Validator.validate
+        with AllocationProfiler() as profiler:
+            for i in range(10):
+                TestSchema({'bar': str(i)}).is_valid
+        self.assertIs(Validator.validate, validate)
+
+        stats = dict((key, (calls, size, peak))
+                     for key, calls, size, _, peak in profiler.stats())
+        self.assertEqual(stats[('schema', 'TestSchema')][0], 10)
+        self.assertEqual(stats[('field', 'TestSchema', 'foo')][0], 10)
+        self.assertEqual(
+            stats[('validator', 'TestSchema', 'bar', 'Int')][0], 10)
+        self.assertEqual(stats[('message', 'TestSchema', 'foo', 'Required',
+                                'required')][0], 10)
+        self.assertTrue(stats[('schema', 'TestSchema')][1] > 0)
+        if hasattr(tracemalloc, 'reset_peak'):
+            # A peak is at least the net size of the call.
+            self.assertTrue(stats[('field', 'TestSchema', 'bar')][2] >=
+                            stats[('field', 'TestSchema', 'bar')][1] // 10)
+            self.assertTrue(
+                stats[('validator', 'TestSchema', 'bar', 'Int')][2] > 0)
+        self.assertIn('schema:TestSchema', profiler.report())
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        profiler.dump(path)
+        with open(path) as f:
+            old = json.load(f)
+        self.assertEqual(old['entries']['field:TestSchema.foo']['calls'], 10)
+
+        with AllocationProfiler() as profiler:
+            TestSchema({'foo': 1, 'bar': '1'}).is_valid
+        diffs = dict((name, size) for name, size, _, _
+                     in compare(old, profiler.snapshot()))
+        self.assertTrue(diffs['message:TestSchema.foo.Required.required'] < 0)
+
+    def test_profiler_collects(self):
+        import gc
+        import weakref
+        from yasv.profiling import AllocationProfiler
+
+        class TestSchema(Schema):
+            foo = Field('Foo', Required())
+
+        enabled = gc.isenabled()
+        refs = []
+        with AllocationProfiler():
+            self.assertFalse(gc.isenabled())
+            for i in range(5000):
+                refs.append(weakref.ref(TestSchema({'foo': i})))
+            # Schemas reference their fields and back, so only the
+            # collections between measured calls free them.
+            self.assertTrue(sum(ref() is None for ref in refs) > 4000)
+        self.assertEqual(gc.isenabled(), enabled)
+
+
+class TestEquivalence(unittest.TestCase):
+
+    def test_engines(self):
+        from yasv.testing import ENGINES, run
+
+        report = run(seed=1, schemas=30, records=30)
+        report.assert_equivalent()
+        self.assertEqual(sorted(report.speedups()),
+                         sorted([name for name, _ in ENGINES] + ['reference']))
+
+    def test_mismatch(self):
+        from yasv.testing import reference, run
+
+        def broken(schema, records):
+            outcomes = reference(schema, records)
+            outcomes[0]['is_valid'] = not outcomes[0]['is_valid']
+            return outcomes
+
+        report = run(schemas=2, records=5, engines=[('broken', broken)])
+        self.assertEqual(len(report.mismatches), 2)
+        self.assertRaises(AssertionError, report.assert_equivalent)
+
+        # Engines reporting other messages still report the same number of
+        # errors per field.
+        def silent(schema, records):
+            outcomes = reference(schema, records)
+            for outcome in outcomes:
+                del outcome['errors']
+                outcome['error_counts'] = dict.fromkeys(
+                    outcome['error_counts'], 0)
+            return outcomes
+
+        report = run(schemas=2, records=5, engines=[('silent', silent)])
+        self.assertTrue(report.mismatches)
+        self.assertEqual(set(m['key'] for m in report.mismatches),
+                         set(['error_counts']))
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        import os
+        import tempfile
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'results.db')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def test_validate_many(self):
+        from yasv.cache import ResultCache
+        hits = []
+
+        # Counted by the cache, as state reachable from validators changes
+        # the fingerprint.
+        class CountedCache(ResultCache):
+            def get_many(self, schema_key, keys):
+                results = super(CountedCache, self).get_many(schema_key, keys)
+                hits.append(len(results))
+                return results
+
+        class TestSchema(Schema):
+            foo = Field('Foo', Required())
+            bar = Field('Bar', is_in([1, 2]))
+
+        Data = namedtuple('Data', ['foo', 'bar'])
+        records = [{'foo': 1, 'bar': 1, 'extra': object()}, {'bar': 3},
+                   Data(foo=2, bar=2), {'foo': object()}]
+        expected = TestSchema.validate_many(records)
+
+        cache = CountedCache(self.path)
+        self.assertEqual(TestSchema.validate_many(records, cache=cache),
+                         expected)
+        self.assertEqual(hits, [0])
+        cache.close()
+
+        cache = CountedCache(self.path)
+        self.assertEqual(TestSchema.validate_many(records, cache=cache),
+                         expected)
+        # Only the record without a stable hash is validated again.
+        self.assertEqual(hits, [0, 3])
+
+        # Results are not reused when the schema changes.
+        TestSchema.bar = Field('Bar', is_in([3]))
+        results = TestSchema.validate_many(records, cache=cache)
+        self.assertEqual(hits, [0, 3, 0])
+        self.assertEqual(results[1], (False, {'foo': ['Value is required.']}))
+
+        # Nothing is cached for validators with no stable description.
+        class Preset(object):
+            pass
+
+        TestSchema.bar = Field('Bar', is_in([Preset()]))
+        expected = TestSchema.validate_many(records)
+        for _ in range(2):
+            self.assertEqual(TestSchema.validate_many(records, cache=cache),
+                             expected)
+        self.assertEqual(hits, [0, 3, 0])
+        cache.close()
+
+    def test_fingerprint_hash_seed(self):
+        import os
+        import subprocess
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ('from yasv.cache import fingerprint; '
+                'from tests.tests import GreekSchema; '
+                'print(fingerprint(GreekSchema))')
+        prints = set()
+        for seed in ['1', '2', '3']:
+            env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=root)
+            prints.add(subprocess.check_output(
+                [sys.executable, '-c', code], cwd=root, env=env))
+        self.assertEqual(len(prints), 1)
+
+    def test_record_key(self):
+        import datetime
+        from yasv.cache import record_key
+
+        names = ['foo']
+        keys = [record_key(names, {'foo': value}) for value in [
+            (1, 2), [1, 2], {'1': 'x'}, '1', 1, 1.0, True, None, [],
+            {'tuple': [1, 2]}, ['date', 'datetime.date(2014, 1, 2)'],
+            datetime.date(2014, 1, 2), {}]]
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual(record_key(names, {'foo': (1, [2])}),
+                         record_key(names, {'foo': (1, [2]), 'bar': 3}))
+        self.assertEqual(record_key(names, {'foo': {1: 'x'}}), None)
+        self.assertEqual(record_key(names, {'foo': object()}), None)
+
+    def test_fingerprint(self):
+        from yasv.cache import fingerprint
+
+        def schema(*validators):
+            class TestSchema(Schema):
+                foo = Field('Foo', *validators)
+            return TestSchema
+
+        class Changed(Required):
+            templates = {'required': 'Changed.'}
+
+        prints = set(fingerprint(s) for s in [
+            schema(length(min=1)), schema(length(min=2)), schema(Required()),
+            schema(Changed()), schema(all_of(Required(), length(min=1))),
+            schema(all_of(Required(), length(min=2))),
+        ])
+        self.assertEqual(len(prints), 6)
+        self.assertEqual(fingerprint(schema(length(min=1))),
+                         fingerprint(schema(length(min=1))))
+
+        class Limit(Validator):
+            LIMIT = 5
+
+            def on_value(self):
+                return self.value <= self.LIMIT
+
+        def limited(limit, default=1):
+            return when(lambda v, s: v > limit + default, Required())
+
+        namespace = {'limit': 1}
+        exec('def over(v, s): return v > limit', namespace)
+
+        prints = set()
+        for limit in [5, 10]:
+            Limit.LIMIT = limit
+            prints.add(fingerprint(schema(Limit())))
+            prints.add(fingerprint(schema(limited(limit))))
+            namespace['limit'] = limit
+            prints.add(fingerprint(schema(when(namespace['over'],
+                                               Required()))))
+        self.assertEqual(len(prints), 6)
+        class Preset(object):
+            pass
+
+        self.assertEqual(fingerprint(schema(is_in([Preset()]))), None)
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.dir = tempfile.mkdtemp()
+        self.records = [{'foo': 1, 'bar': 1}, {'bar': 3}] * 10 + [{'foo': 2}]
+        self.expected = ServerSchema.validate_many(self.records)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def serve(self, **kwargs):
+        import os
+        import threading
+        server = Server({'test': ServerSchema},
+                        os.path.join(self.dir, 'yasv.sock'), **kwargs)
+        server.start()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.close)
+        client = Client(server.address, pool_size=2)
+        self.addCleanup(client.close)
+        return client
+
+    def test_in_process(self):
+        client = self.serve(workers=0)
+        self.assertEqual(client.validate('test', self.records), self.expected)
+        self.assertEqual(client.validate('test', []), [])
+        self.assertRaises(ServerError, client.validate, 'missing', [{}])
+        # Connections are reused after errors reported by the server.
+        self.assertEqual(client._pool.qsize(), 1)
+
+    def test_workers(self):
+        import threading
+        client = self.serve(workers=2, batch_delay=0.01)
+        results = []
+
+        def validate():
+            results.append(client.validate('test', self.records))
+
+        threads = [threading.Thread(target=validate) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [self.expected] * 8)
+        self.assertTrue(client._pool.qsize() <= 2)
+
+    def test_close_without_serving(self):
+        import os
+        import threading
+        server = Server({'test': ServerSchema},
+                        os.path.join(self.dir, 'yasv.sock'), workers=0)
+        server.start()
+        thread = threading.Thread(target=server.close)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(server.address))
+        # A closed server is not served until started again.
+        server.serve_forever()
+
+    def test_failing_request(self):
+        import multiprocessing
+        from yasv.server import _Request, _init_worker
+
+        class RangeSchema(Schema):
+            n = Field('N', in_range(min=1, max=5))
+
+        for workers in [0, 1]:
+            server = Server({'range': RangeSchema}, '', workers=workers)
+            if workers:
+                server._pool = multiprocessing.Pool(
+                    1, _init_worker, (server.schemas, ))
+                self.addCleanup(server._pool.terminate)
+            poisoned = _Request('range', [{'n': 'x'}])
+            valid = _Request('range', [{'n': 3}, {'n': 7}])
+            server._run([poisoned, valid])
+            self.assertTrue(poisoned.error.startswith('TypeError'))
+            self.assertEqual(valid.error, None)
+            self.assertEqual(valid.results, [
+                (True, {}), (False, {'n': ['Value must be between 1 and 5.']})])
+
+    def test_batch_delay(self):
+        import time
+        import threading
+        from yasv.server import _Request
+        batches = []
+
+        class RecordingServer(Server):
+            def _run(self, batch):
+                batches.append(len(batch))
+
+        server = RecordingServer({'test': ServerSchema}, '', workers=0,
+                                 batch_delay=0.3)
+        thread = threading.Thread(target=server._batch_loop)
+        thread.start()
+        # A steady trickle of requests does not extend the first batch.
+        for _ in range(10):
+            server._queue.put(_Request('test', [{}]))
+            time.sleep(0.1)
+        server._queue.put(None)
+        thread.join()
+        self.assertEqual(sum(batches), 10)
+        self.assertTrue(len(batches) >= 2)
+        self.assertTrue(batches[0] <= 5)
+
+    def test_max_frame_size(self):
+        client = self.serve(workers=0, max_frame_size=100)
+        self.assertRaises(ServerError, client.validate, 'test',
+                          [{'foo': 'x' * 100}])
+        # The connection is still usable after the rejected frame.
+        self.assertEqual(client._pool.qsize(), 1)
+        self.assertEqual(client.validate('test', [{'foo': 1, 'bar': 1}]),
+                         [(True, {})])
+        self.assertEqual(client._pool.qsize(), 1)
+
+    def test_load_schema(self):
+        self.assertIs(load_schema('yasv.core:Schema'), Schema)
+        self.assertIs(load_schema('yasv.core.Schema'), Schema)
+        self.assertRaises(ValueError, load_schema, 'Schema')
+
 
 if __name__ == '__main__':
     unittest.main()
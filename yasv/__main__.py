@@ -0,0 +1,5 @@
+import sys
+
+from yasv.server import main
+
+sys.exit(main())
@@ -0,0 +1,313 @@
+import re
+import json
+import uuid
+import types
+import decimal
+import hashlib
+import sqlite3
+import datetime
+import threading
+
+from six import iteritems, integer_types, string_types, binary_type
+
+import yasv
+from yasv.core import Field, Schema
+from yasv.validators import Validator
+
+# Max number of parameters of one SQLite query.
+MAX_VARIABLES = 500
+
+
+# Types of values, which are hashed by their repr.
+TAGGED_TYPES = (datetime.datetime, datetime.date, datetime.time,
+                decimal.Decimal, uuid.UUID)
+
+# Class attributes, which are caches filled at runtime.
+IGNORED_ATTRIBUTES = ('_unbound_fields', '_projections', '_outputs', '_pool')
+
+REGEXP_TYPE = type(re.compile(''))
+
+
+def _describe(obj, stack=()):
+    """ Return a JSON serializable description of the object, which changes
+    whenever the object affects validation results differently. Raises
+    TypeError for objects with no stable description.
+
+    `stack` is a tuple of ids of classes and functions being described, so
+    recursive references are described by name.
+    """
+    if obj is None or isinstance(obj, (bool, float) + integer_types +
+                                 string_types + (binary_type, ) +
+                                 TAGGED_TYPES):
+        return repr(obj)
+    if isinstance(obj, Field):
+        return ['field', _describe(obj.__class__, stack), obj._label,
+                [_describe(v, stack) for v in obj.validators],
+                _describe(obj._kwargs, stack)]
+    if isinstance(obj, Validator):
+        return ['validator', _describe(obj.__class__, stack),
+                _describe(obj._args, stack), _describe(obj._kwargs, stack),
+                _describe(obj._context, stack),
+                _describe(obj.templates, stack)]
+    if isinstance(obj, dict):
+        return ['dict', sorted(([_describe(k, stack), _describe(v, stack)]
+                                for k, v in iteritems(obj)), key=json.dumps)]
+    if isinstance(obj, (set, frozenset)):
+        # Sorted, as the order of items depends on the hash seed.
+        return ['set', sorted((_describe(v, stack) for v in obj),
+                              key=json.dumps)]
+    if isinstance(obj, (list, tuple)):
+        return [_describe(v, stack) for v in obj]
+    if isinstance(obj, REGEXP_TYPE):
+        return ['regexp', obj.pattern, obj.flags]
+    if isinstance(obj, types.ModuleType):
+        return ['module', obj.__name__]
+    if type(obj) is object:
+        # A sentinel, which is compared by identity.
+        return ['object']
+    if isinstance(obj, type):
+        return _describe_class(obj, stack)
+    if isinstance(obj, types.FunctionType):
+        return _describe_function(obj, stack)
+    if isinstance(obj, types.MethodType):
+        return ['method', _describe(obj.__self__, stack),
+                _describe(obj.__func__, stack)]
+    if isinstance(obj, types.BuiltinFunctionType) and \
+            isinstance(obj.__self__, (types.ModuleType, type(None))):
+        return ['builtin', getattr(obj.__self__, '__name__', None),
+                obj.__name__]
+    raise TypeError('No stable description of {0!r}.'.format(obj))
+
+
+def _describe_class(klass, stack):
+    """ Describe validation classes by their attributes, including code of
+    methods, so changed validators are noticed. Other classes are described
+    by name.
+    """
+    name = [klass.__module__, klass.__name__]
+    if not issubclass(klass, (Validator, Field, Schema)):
+        return ['class'] + name
+    if id(klass) in stack:
+        return ['recursive'] + name
+    stack += (id(klass), )
+    attrs = []
+    for base in klass.__mro__:
+        if base is object:
+            continue
+        for attr_name, attr in sorted(iteritems(vars(base))):
+            if attr_name in IGNORED_ATTRIBUTES or \
+                    attr_name.startswith('_abc_'):
+                continue
+            if isinstance(attr, (staticmethod, classmethod)):
+                attr = attr.__func__
+            if isinstance(attr, property):
+                value = ['property'] + [_describe(f, stack) for f in
+                                        (attr.fget, attr.fset, attr.fdel)]
+            elif isinstance(attr, types.FunctionType):
+                value = _describe(attr, stack)
+            elif attr_name.startswith('__') and attr_name.endswith('__'):
+                # Docs, slots and other special attributes.
+                value = None
+            else:
+                value = _describe(attr, stack)
+            attrs.append([base.__name__, attr_name, value])
+    return ['class'] + name + [attrs]
+
+
+def _describe_function(func, stack):
+    """ Describe the code of the function, its defaults, closure and values
+    of globals it uses. Functions and classes of other modules used as
+    globals are described by name.
+    """
+    name = [func.__module__, func.__name__]
+    if id(func) in stack:
+        return ['recursive'] + name
+    stack += (id(func), )
+    closure = []
+    for cell in func.__closure__ or ():
+        try:
+            closure.append(_describe(cell.cell_contents, stack))
+        except ValueError:
+            # The variable is not assigned yet.
+            closure.append(['empty'])
+    used = []
+    for global_name in sorted(_global_names(func.__code__)):
+        if global_name not in func.__globals__:
+            # A builtin or an attribute name.
+            continue
+        value = func.__globals__[global_name]
+        if isinstance(value, (type, types.FunctionType)) and \
+                value.__module__ != func.__module__:
+            value = ['global', value.__module__, value.__name__]
+        else:
+            value = _describe(value, stack)
+        used.append([global_name, value])
+    return ['function'] + name + [
+        _describe_code(func.__code__), _describe(func.__defaults__, stack),
+        _describe(getattr(func, '__kwdefaults__', None), stack), closure,
+        used]
+
+
+def _global_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            names.update(_global_names(const))
+    return names
+
+
+def _describe_code(code):
+    return [repr(code.co_code), [_describe_const(c) for c in code.co_consts],
+            list(code.co_names)]
+
+
+def _describe_const(const):
+    if hasattr(const, 'co_code'):
+        return _describe_code(const)
+    if isinstance(const, frozenset):
+        # E.g. `value in {'a', 'b'}`, sorted as the order of items depends
+        # on the hash seed.
+        return ['frozenset', sorted((_describe_const(c) for c in const),
+                                    key=json.dumps)]
+    if isinstance(const, tuple):
+        return [_describe_const(c) for c in const]
+    return repr(const)
+
+
+def fingerprint(schema, fields=None):
+    """ Return a hash of the fields of the `Schema` subclass, their
+    validators, validator parameters and templates, and of the yasv version.
+    `fields` is a dict of fields to use instead of all fields of the schema.
+    Returns None if a validator has parameters with no stable description,
+    so results of the schema cannot be cached.
+    """
+    if fields is None:
+        fields = schema._get_unbound_fields()
+    try:
+        description = [yasv.__version__, _describe(schema),
+                       _describe(fields)]
+    except TypeError:
+        return None
+    return hashlib.sha1(json.dumps(description).encode('utf-8')).hexdigest()
+
+
+def _canonical(value):
+    """ Return a JSON serializable form of the value, which is distinct for
+    values of different types. Raises TypeError for values with no stable
+    form.
+    """
+    if value is None or isinstance(value, (bool, float) + integer_types +
+                                   string_types):
+        return value
+    if isinstance(value, list):
+        return [_canonical(v) for v in value]
+    # Other values are wrapped into dicts with one key naming their type,
+    # so they do not collide with lists, strings and each other.
+    if isinstance(value, tuple):
+        return {'tuple': [_canonical(v) for v in value]}
+    if isinstance(value, dict):
+        if not all(isinstance(k, string_types) for k in value):
+            raise TypeError()
+        return {'dict': dict((k, _canonical(v)) for k, v in iteritems(value))}
+    if type(value) in TAGGED_TYPES:
+        return {value.__class__.__name__: repr(value)}
+    raise TypeError()
+
+
+def record_key(names, data):
+    """ Return a hash of the values of declared fields of the data, or None
+    if a value has no stable representation.
+    """
+    values = {}
+    try:
+        if isinstance(data, dict):
+            for name in names:
+                if name in data:
+                    values[name] = _canonical(data[name])
+        else:
+            for name in names:
+                try:
+                    values[name] = _canonical(getattr(data, name))
+                except AttributeError:
+                    pass
+        key = json.dumps(values, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class ResultCache(object):
+    """ Persistent cache of validation results stored in a SQLite database.
+
+    Results are stored per schema fingerprint and record hash, so results of
+    a changed schema are never reused. Pass it to `Schema.validate_many`.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'schema TEXT, record TEXT, is_valid INTEGER, errors TEXT, '
+            'PRIMARY KEY (schema, record))')
+        self._db.commit()
+
+    def validate_many(self, schema, records, only=None, exclude=None):
+        """ Validate records with the `Schema` subclass, reusing cached
+        results. Returns a list of (is_valid, errors) pairs.
+        """
+        records = list(records)
+        _, fields = schema._get_projection(only, exclude)
+        schema_key = fingerprint(schema, fields)
+        if schema_key is None:
+            return schema.validate_many(records, only=only, exclude=exclude)
+        names = list(fields)
+        keys = [record_key(names, data) for data in records]
+        cached = self.get_many(schema_key, [key for key in keys if key])
+
+        missed = [i for i, key in enumerate(keys) if key not in cached]
+        computed = dict(zip(missed, schema.validate_many(
+            [records[i] for i in missed], only=only, exclude=exclude)))
+        self.set_many(schema_key, dict(
+            (keys[i], result) for i, result in iteritems(computed)
+            if keys[i] is not None))
+
+        return [computed[i] if i in computed else cached[key]
+                for i, key in enumerate(keys)]
+
+    def get_many(self, schema_key, keys):
+        """ Return a dict of record key: (is_valid, errors) of cached results.
+        """
+        keys = list(set(keys))
+        results = {}
+        with self._lock:
+            for i in range(0, len(keys), MAX_VARIABLES):
+                chunk = keys[i:i + MAX_VARIABLES]
+                rows = self._db.execute(
+                    'SELECT record, is_valid, errors FROM results '
+                    'WHERE schema = ? AND record IN ({0})'.format(
+                        ', '.join('?' * len(chunk))), [schema_key] + chunk)
+                for key, is_valid, errors in rows:
+                    results[key] = (bool(is_valid), json.loads(errors))
+        return results
+
+    def set_many(self, schema_key, results):
+        """ Store a dict of record key: (is_valid, errors).
+        """
+        with self._lock:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                [(schema_key, key, int(is_valid), json.dumps(errors))
+                 for key, (is_valid, errors) in iteritems(results)])
+            self._db.commit()
+
+    def clear(self):
+        """ Remove all cached results.
+        """
+        with self._lock:
+            self._db.execute('DELETE FROM results')
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,80 @@
+import base64
+import socket
+
+from six import string_types
+from six.moves import queue
+
+from yasv.errors import ServerError
+from yasv.protocol import unpack_bitmap, send_frame, recv_frame
+
+
+class Client(object):
+    """ Client of `yasv.server.Server` keeping a pool of up to `pool_size`
+    idle connections. Safe to use from several threads.
+    """
+    def __init__(self, address, pool_size=4, timeout=None):
+        self.address = address
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+
+    def validate(self, schema, records):
+        """ Validate records with the schema registered on the server under
+        the name. Returns a list of (is_valid, errors) pairs in the order of
+        records.
+        """
+        message = {'schema': schema, 'records': list(records)}
+        connection = self._acquire()
+        try:
+            send_frame(connection[0], message)
+            response = recv_frame(connection[1])
+        except Exception:
+            self._close(connection)
+            raise
+        if response is None:
+            self._close(connection)
+            raise ServerError('Connection closed by the server.')
+        self._release(connection)
+
+        if 'error' in response:
+            raise ServerError(response['error'])
+        flags = unpack_bitmap(base64.b64decode(response['valid']),
+                              response['count'])
+        errors = response['errors']
+        return [(flag, errors.get(str(i), {})) for i, flag in enumerate(flags)]
+
+    def close(self):
+        """ Close idle connections.
+        """
+        while True:
+            try:
+                self._close(self._pool.get_nowait())
+            except queue.Empty:
+                return
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        if isinstance(self.address, string_types):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+        except socket.error:
+            sock.close()
+            raise
+        return sock, sock.makefile('rb')
+
+    def _release(self, connection):
+        if self._pool.qsize() < self.pool_size:
+            self._pool.put(connection)
+        else:
+            self._close(connection)
+
+    def _close(self, connection):
+        connection[1].close()
+        connection[0].close()
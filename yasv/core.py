@@ -1,7 +1,12 @@
+import threading
+from collections import namedtuple
+
 from six import with_metaclass, iteritems, itervalues, string_types
 
 from yasv.validators import Validator
 from yasv.errors import ValidationError
+from yasv.scanner import scan_object
+from yasv.records import record_class
 
 
 class Field(object):
@@ -11,9 +16,13 @@ class Field(object):
 
         Accepts a list of args. If arg is str or unicode - it sets as label.
         If arg is instance of `Validator` - it appends to a validators list.
+        `depends` keyword is a list of names of fields used by validators of
+        the field, they are validated together with the field when only some
+        fields of a schema are validated.
         """
         self._args = args
         self._kwargs = kwargs
+        self.depends = kwargs.get('depends', ())
         self.validators = []
         self._label = None
         self.raw_data = None
@@ -21,6 +30,10 @@ class Field(object):
         self.errors = []
         self._is_valid = True
         self._is_validated = False
+        # Errors are not reported while greater than zero.
+        self._muted = 0
+        # Name of the pattern matched by `PatternSet`.
+        self.matched = None
         self.name = ''
 
         for arg in args:
@@ -78,6 +91,17 @@ class Field(object):
         if message:
             self.errors.append(message)
 
+    def reset(self):
+        """ Clear data and validation state, so the field can be reused for
+        a new input.
+        """
+        self.raw_data = None
+        self._cleaned_data = None
+        self.errors = []
+        self._is_valid = True
+        self._is_validated = False
+        self.matched = None
+
 
 class SchemaMeta(type):
     """ The metaclass for `Schema` and any subclasses of `Schema`.
@@ -94,11 +118,20 @@ class SchemaMeta(type):
     def __init__(cls, name, bases, attrs):
         type.__init__(cls, name, bases, attrs)
         cls._unbound_fields = None
+        cls._projections = {}
+        cls._outputs = {}
+        cls._pool = threading.local()
 
     def __call__(cls, *args, **kwargs):
         """ Construct a new `Schema` instance, creating `_unbound_fields` on the
         class if it is empty.
         """
+        cls._get_unbound_fields()
+        return type.__call__(cls, *args, **kwargs)
+
+    def _get_unbound_fields(cls):
+        """ Return `_unbound_fields`, creating it if it is empty.
+        """
         if cls._unbound_fields is None:
             fields = {}
             for name in dir(cls):
@@ -109,7 +142,38 @@ class SchemaMeta(type):
             assert fields, ('`Schema` subclasses have to define at least one '
                 'unbound `Field` attribute.')
             cls._unbound_fields = fields
-        return type.__call__(cls, *args, **kwargs)
+            cls._projections = {}
+            cls._outputs = {}
+        return cls._unbound_fields
+
+    def _get_projection(cls, only=None, exclude=None):
+        """ Return a (key, fields) pair, where fields is a dict of unbound
+        fields selected by `only` and `exclude` names and fields they depend
+        on. The dict is cached under the key, which is None for all fields.
+        """
+        fields = cls._get_unbound_fields()
+        if only is None and not exclude:
+            return None, fields
+        key = (None if only is None else frozenset(only),
+               frozenset(exclude or ()))
+        projection = cls._projections.get(key)
+        if projection is None:
+            unknown = (key[0] or frozenset()).union(key[1]).difference(fields)
+            if unknown:
+                raise ValueError('Unknown fields: {0}.'.format(
+                    ', '.join(sorted(unknown))))
+            names = set(fields if key[0] is None else key[0]) - key[1]
+            pending = list(names)
+            while pending:
+                for name in fields[pending.pop()].depends:
+                    if name not in fields:
+                        raise ValueError('Unknown field: {0}.'.format(name))
+                    if name not in names:
+                        names.add(name)
+                        pending.append(name)
+            projection = dict((name, fields[name]) for name in names)
+            cls._projections[key] = projection
+        return key, projection
 
     def __setattr__(cls, name, value):
         """ Add an attribute to the class, clearing `_unbound_fields` if needed.
@@ -127,22 +191,234 @@ class SchemaMeta(type):
         type.__delattr__(cls, name)
 
 
+def _reduce_output(output):
+    return _restore_output, output._source + (tuple(output), )
+
+
+def _restore_output(schema, kind, key, values):
+    """ Rebuild an instance of `record_class` or `tuple_class` of the schema
+    from pickled values.
+    """
+    if key is None:
+        key, fields = schema._get_projection()
+    else:
+        key, fields = schema._get_projection(*key)
+    return schema._get_output_class(kind, key, fields)(*values)
+
+
 class Schema(with_metaclass(SchemaMeta)):
 
-    def __init__(self, data):
+    # Max number of released instances kept per thread by `acquire`.
+    _pool_size = 32
+
+    def __init__(self, data, only=None, exclude=None):
         """ Construct a new `Schema` instance.
 
         Accepts data as a dict or namedtuple or any object with attributes.
-        Creates fields dict with data.
+        Creates fields dict with data. If `only` or `exclude` lists of field
+        names are given, only the selected fields and fields they depend on
+        are created and validated.
         """
-        self._is_valid = True
-        self._is_validated = False
+        self._projection, self._bound_fields = \
+            self.__class__._get_projection(only, exclude)
         self._fields = {}
-        for name, field in iteritems(self._unbound_fields):
+        for name, field in iteritems(self._bound_fields):
             self._fields[name] = field.__class__(*field._args, **field._kwargs)
             self._fields[name]._schema = self
             self._fields[name].name = name
+        self._bind(data)
+
+    @classmethod
+    def from_json_bytes(cls, buf, only=None, exclude=None):
+        """ Construct a new `Schema` instance from a JSON object.
 
+        Accepts `bytes`, `bytearray`, `memoryview` or text. Only values of
+        the schema fields are decoded, other values are skipped. Syntax of
+        some skipped values is checked less strictly than by `json.loads`,
+        see `yasv.scanner.scan_object`.
+        """
+        _, fields = cls._get_projection(only, exclude)
+        return cls(scan_object(buf, fields), only=only, exclude=exclude)
+
+    @classmethod
+    def validate_many(cls, records, cache=None, only=None, exclude=None):
+        """ Validate a sequence of data with one pooled instance.
+
+        Returns a list of (is_valid, errors) pairs in the order of records.
+        If `cache` is a `yasv.cache.ResultCache`, results of records validated
+        before are taken from it.
+        """
+        if cache is not None:
+            return cache.validate_many(cls, records, only=only,
+                                       exclude=exclude)
+        results = []
+        schema = None
+        for data in records:
+            if schema is None:
+                schema = cls.acquire(data, only=only, exclude=exclude)
+            else:
+                schema.rebind(data)
+            results.append((schema.is_valid, schema.get_errors()))
+        if schema is not None:
+            schema.release()
+        return results
+
+    @classmethod
+    def clean_many(cls, records, output='record', only=None, exclude=None):
+        """ Validate a sequence of data with one pooled instance and collect
+        cleaned data of valid ones.
+
+        `output` is 'record' for instances of `record_class`, 'tuple' for
+        instances of `tuple_class` or 'columns' for a dict of field name:
+        list of values. Returns a (cleaned, errors) pair, where errors is a
+        dict of index: errors of invalid data.
+        """
+        key, fields = cls._get_projection(only, exclude)
+        if output == 'columns':
+            names = sorted(fields)
+            cleaned = dict((name, []) for name in names)
+        elif output in ('record', 'tuple'):
+            output_class = cls._get_output_class(output, key, fields)
+            names = output_class._fields
+            cleaned = []
+        else:
+            raise ValueError('Unknown output: {0}.'.format(output))
+
+        errors = {}
+        schema = None
+        for i, data in enumerate(records):
+            if schema is None:
+                schema = cls.acquire(data, only=only, exclude=exclude)
+            else:
+                schema.rebind(data)
+            if not schema.is_valid:
+                errors[i] = schema.get_errors()
+            elif output == 'columns':
+                for name in names:
+                    cleaned[name].append(schema._fields[name].cleaned_data)
+            else:
+                cleaned.append(output_class(*[
+                    schema._fields[name].cleaned_data for name in names]))
+        if schema is not None:
+            schema.release()
+        return cleaned, errors
+
+    @classmethod
+    def record_class(cls, only=None, exclude=None):
+        """ Return a `yasv.records.Record` subclass with `__slots__` for
+        cleaned data of the selected fields, in the order of their names.
+        """
+        key, fields = cls._get_projection(only, exclude)
+        return cls._get_output_class('record', key, fields)
+
+    @classmethod
+    def tuple_class(cls, only=None, exclude=None):
+        """ Return a namedtuple for cleaned data of the selected fields, in
+        the order of their names.
+        """
+        key, fields = cls._get_projection(only, exclude)
+        return cls._get_output_class('tuple', key, fields)
+
+    @classmethod
+    def _get_output_class(cls, kind, key, fields):
+        output_class = cls._outputs.get((kind, key))
+        if output_class is None:
+            if kind == 'record':
+                output_class = record_class(cls.__name__ + 'Record',
+                                            sorted(fields))
+            else:
+                output_class = namedtuple(cls.__name__ + 'Tuple',
+                                          sorted(fields))
+            # Generated classes cannot be found by name, so instances are
+            # pickled as the schema and values to rebuild them from.
+            output_class._source = (cls, kind, key)
+            output_class.__reduce__ = _reduce_output
+            cls._outputs[(kind, key)] = output_class
+        return output_class
+
+    def as_record(self):
+        """ Return cleaned data as an instance of `record_class`, or None if
+        the data is invalid.
+        """
+        return self._as_output('record')
+
+    def as_tuple(self):
+        """ Return cleaned data as an instance of `tuple_class`, or None if
+        the data is invalid.
+        """
+        return self._as_output('tuple')
+
+    def _as_output(self, kind):
+        if not self.is_valid:
+            return None
+        output_class = self._get_output_class(kind, self._projection,
+                                              self._bound_fields)
+        return output_class(*[self._fields[name].cleaned_data
+                              for name in output_class._fields])
+
+    @classmethod
+    def acquire(cls, data, only=None, exclude=None):
+        """ Return a schema instance bound to data, reusing an instance
+        previously returned to the current thread's pool by `release`.
+
+        Pooled instances do not share validators with other instances, so
+        they can be used concurrently from several threads.
+        """
+        key, fields = cls._get_projection(only, exclude)
+        instances = cls._get_pooled(key)
+        while instances:
+            schema = instances.pop()
+            # Instances created before the fields were changed are stale.
+            if schema._bound_fields is fields:
+                # Fields were reset by `release`.
+                schema._bind(data)
+                return schema
+        schema = cls(data, only=only, exclude=exclude)
+        # Validators keep the state of a validation, so pooled instances,
+        # which may be used by several threads at once, get own copies.
+        for field in schema.values():
+            field.validators = [v.clone() for v in field.validators]
+        return schema
+
+    def release(self):
+        """ Return the instance to the current thread's pool. The instance
+        must not be used after that. Its fields are reset, so pooled
+        instances do not keep the data alive.
+        """
+        cls = self.__class__
+        if self._projection is None:
+            fields = cls._unbound_fields
+        else:
+            fields = cls._projections.get(self._projection)
+        if self._bound_fields is not fields:
+            return
+        instances = cls._get_pooled(self._projection)
+        if len(instances) < self._pool_size:
+            for field in self.values():
+                field.reset()
+            instances.append(self)
+
+    @classmethod
+    def _get_pooled(cls, key):
+        """ Return a list of pooled instances of the current thread for the
+        projection key.
+        """
+        pools = getattr(cls._pool, 'instances', None)
+        if pools is None:
+            pools = cls._pool.instances = {}
+        return pools.setdefault(key, [])
+
+    def rebind(self, data):
+        """ Reset validation state of the schema and its fields and bind
+        them to a new data. Field objects are reused.
+        """
+        for field in self.values():
+            field.reset()
+        self._bind(data)
+
+    def _bind(self, data):
+        self._is_valid = True
+        self._is_validated = False
         if isinstance(data, dict):
             for name, value in iteritems(data):
                 self._add_data_to_field(name, value)
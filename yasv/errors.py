@@ -3,3 +3,8 @@ class ValidationError(Exception):
     """
     def __init__(self):
         self.error_response = {}
+
+
+class ServerError(Exception):
+    """ Raised when a validation server fails to process a request.
+    """
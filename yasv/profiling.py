@@ -0,0 +1,241 @@
+import gc
+import sys
+import json
+import functools
+import threading
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from six import iteritems
+
+import yasv
+from yasv.core import Field, Schema
+from yasv.validators import Validator
+
+
+def _schema_name(field):
+    schema = getattr(field, '_schema', None)
+    return schema.__class__.__name__ if schema is not None else ''
+
+
+# Functions to patch, as (class, method name, key function). Key function
+# accepts arguments of the method and returns a key of the entry which the
+# allocations are attributed to.
+PATCHES = [
+    (Schema, '__init__',
+     lambda self, *args, **kwargs: ('schema', self.__class__.__name__)),
+    (Schema, 'rebind',
+     lambda self, data: ('rebind', self.__class__.__name__)),
+    (Field, 'validate',
+     lambda self: ('field', _schema_name(self), self.name)),
+    (Validator, 'validate',
+     lambda self, field, fields: ('validator', _schema_name(field),
+                                  field.name, self.__class__.__name__)),
+    (Validator, 'message',
+     lambda self, key, *args: ('message', _schema_name(self.field),
+                               self.field.name, self.__class__.__name__,
+                               key)),
+    (Validator, 'context',
+     lambda self, *args, **kwargs: ('context', self.__class__.__name__)),
+]
+
+
+class AllocationProfiler(object):
+    """ Attributes memory allocated during validation to schema classes,
+    fields, validators and error messages.
+
+    While the profiler is running, methods of `Schema`, `Field` and
+    `Validator` are wrapped to measure the net change of memory traced by
+    `tracemalloc` and of the number of allocated blocks during each call,
+    and the peak of traced memory above its size at the start of the call.
+    The peak shows short-lived allocations, e.g. discarded `context`
+    clones, which net changes hide. It is measured on Python 3.9+ only, as
+    it needs `tracemalloc.reset_peak`. Numbers of an entry include numbers
+    of entries nested into it, e.g. a field includes its validators.
+
+    The automatic garbage collection is disabled while the profiler is
+    running. Garbage is collected between measured calls instead, when no
+    call is measured in any thread. Use it as a context manager: ::
+
+        with AllocationProfiler() as profiler:
+            UserSchema(data).is_valid
+        print(profiler.report())
+    """
+    def __init__(self):
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._originals = None
+        self._started_tracing = False
+        self._gc_enabled = False
+        # Number of measured calls running in all threads.
+        self._active = 0
+        self._local = threading.local()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        if tracemalloc is None:
+            raise RuntimeError('tracemalloc is required for profiling.')
+        if self._originals is not None:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        # Schemas and their fields reference each other, so they are freed
+        # by the garbage collector, whenever it runs. Memory it frees inside
+        # a profiled call would be attributed to that call, so it runs only
+        # between calls.
+        self._gc_enabled = gc.isenabled()
+        gc.disable()
+        self._originals = []
+        for cls, name, key in PATCHES:
+            original = cls.__dict__[name]
+            self._originals.append((cls, name, original))
+            setattr(cls, name, self._wrap(original, key))
+
+    def stop(self):
+        if self._originals is None:
+            return
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals = None
+        if self._gc_enabled:
+            gc.enable()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _wrap(self, func, key_func):
+        get_traced_memory = tracemalloc.get_traced_memory
+        reset_peak = getattr(tracemalloc, 'reset_peak', None)
+        get_blocks = getattr(sys, 'getallocatedblocks', lambda: 0)
+        entries = self.entries
+        lock = self._lock
+        local = self._local
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # A stack of [size at start, peak] of calls of the thread.
+            stack = getattr(local, 'stack', None)
+            if stack is None:
+                stack = local.stack = []
+            with lock:
+                self._active += 1
+            size, peak = get_traced_memory()
+            if reset_peak is not None:
+                # The peak is reset by every call, so the peak before it
+                # is passed to the enclosing call.
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+                reset_peak()
+            frame = [size, size]
+            stack.append(frame)
+            blocks = get_blocks()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                current, peak = get_traced_memory()
+                blocks = get_blocks() - blocks
+                stack.pop()
+                if reset_peak is not None:
+                    frame[1] = max(frame[1], peak)
+                    reset_peak()
+                    if stack:
+                        stack[-1][1] = max(stack[-1][1], frame[1])
+                key = key_func(*args, **kwargs)
+                with lock:
+                    entry = entries.get(key)
+                    if entry is None:
+                        entry = entries[key] = [0, 0, 0, 0]
+                    entry[0] += 1
+                    entry[1] += current - size
+                    entry[2] += blocks
+                    entry[3] = max(entry[3], frame[1] - size)
+                    self._active -= 1
+                    idle = not self._active
+                if idle:
+                    _collect()
+        return wrapper
+
+    def stats(self):
+        """ Return a list of (key, calls, size, blocks, peak), sorted by
+        size. Peak is the largest peak of one call.
+        """
+        with self._lock:
+            stats = [(key, ) + tuple(entry)
+                     for key, entry in iteritems(self.entries)]
+        return sorted(stats, key=lambda stat: (-stat[2], stat[0]))
+
+    def report(self, limit=20):
+        """ Return a table of entries with the largest allocated size.
+        """
+        lines = ['{0:>12} {1:>10} {2:>10} {3:>10} {4:>8}  {5}'.format(
+            'size', 'blocks', 'size/call', 'peak', 'calls', 'entry')]
+        for key, calls, size, blocks, peak in self.stats()[:limit]:
+            lines.append('{0:>12} {1:>10} {2:>10} {3:>10} {4:>8}  {5}'.format(
+                size, blocks, size // calls, peak, calls, _format_key(key)))
+        return '\n'.join(lines)
+
+    def snapshot(self):
+        """ Return a JSON serializable dict of entries, which can be compared
+        with another snapshot by `compare`.
+        """
+        return {
+            'version': yasv.__version__,
+            'entries': dict(
+                (_format_key(key), {'calls': calls, 'size': size,
+                                    'blocks': blocks, 'peak': peak})
+                for key, calls, size, blocks, peak in self.stats()),
+        }
+
+    def dump(self, path):
+        """ Write the snapshot to a JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+
+
+def _collect():
+    """ Collect garbage like the automatic collection would, when the number
+    of allocations exceeds the thresholds.
+    """
+    counts = gc.get_count()
+    thresholds = gc.get_threshold()
+    for generation in range(len(counts) - 1, -1, -1):
+        if generation < len(thresholds) and thresholds[generation] and \
+                counts[generation] >= thresholds[generation]:
+            gc.collect(generation)
+            return
+
+
+def _format_key(key):
+    return '{0}:{1}'.format(key[0], '.'.join(str(part) for part in key[1:]))
+
+
+def compare(old, new):
+    """ Compare two snapshots. Returns a list of (entry, size/call diff,
+    blocks/call diff, peak diff), sorted by the absolute size diff.
+    """
+    def per_call(snapshot, name):
+        entry = snapshot['entries'].get(name)
+        if not entry:
+            return 0, 0, 0
+        calls = entry['calls'] or 1
+        return (float(entry['size']) / calls, float(entry['blocks']) / calls,
+                entry.get('peak', 0))
+
+    diffs = []
+    for name in set(old['entries']).union(new['entries']):
+        old_size, old_blocks, old_peak = per_call(old, name)
+        new_size, new_blocks, new_peak = per_call(new, name)
+        diffs.append((name, new_size - old_size, new_blocks - old_blocks,
+                      new_peak - old_peak))
+    return sorted(diffs, key=lambda diff: (-abs(diff[1]), diff[0]))
@@ -0,0 +1,72 @@
+import json
+import struct
+
+HEADER = struct.Struct('>I')
+# Default max size of a frame body accepted by the server.
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+
+class FrameTooLarge(ValueError):
+    """ Raised when a frame is larger than the allowed size. The body of
+    the frame, `size` bytes, is left unread.
+    """
+    def __init__(self, size, max_size):
+        super(FrameTooLarge, self).__init__(
+            'Frame of {0} bytes is larger than {1} bytes.'.format(
+                size, max_size))
+        self.size = size
+
+
+def pack_bitmap(flags):
+    """ Pack a sequence of booleans into bytes, the first flag is the lowest
+    bit of the first byte.
+    """
+    bitmap = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            bitmap[i >> 3] |= 1 << (i & 7)
+    return bytes(bitmap)
+
+
+def unpack_bitmap(bitmap, count):
+    """ Unpack `count` booleans packed by `pack_bitmap`.
+    """
+    bitmap = bytearray(bitmap)
+    return [bool(bitmap[i >> 3] & (1 << (i & 7))) for i in range(count)]
+
+
+def send_frame(sock, message):
+    """ Send a message as a JSON document prefixed by its length.
+    """
+    body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def recv_frame(rfile, max_size=None):
+    """ Read a message sent by `send_frame` from a file-like object.
+
+    Returns None if the connection was closed before the message. Raises
+    `FrameTooLarge` if the message is larger than `max_size` bytes.
+    """
+    header = rfile.read(HEADER.size)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        raise EOFError('Connection closed inside a frame header.')
+    size, = HEADER.unpack(header)
+    if max_size is not None and size > max_size:
+        raise FrameTooLarge(size, max_size)
+    body = rfile.read(size)
+    if len(body) < size:
+        raise EOFError('Connection closed inside a frame.')
+    return json.loads(body.decode('utf-8'))
+
+
+def skip_frame(rfile, size, chunk_size=65536):
+    """ Read and drop `size` bytes of a frame body.
+    """
+    while size > 0:
+        chunk = rfile.read(min(size, chunk_size))
+        if not chunk:
+            raise EOFError('Connection closed inside a frame.')
+        size -= len(chunk)
@@ -0,0 +1,63 @@
+import re
+import keyword
+
+from six import exec_
+
+IDENTIFIER = re.compile(r'^[a-zA-Z][a-zA-Z0-9_]*$')
+
+
+class Record(object):
+    """ Base class of compact records of cleaned data, generated by
+    `record_class`.
+    """
+    __slots__ = ()
+    __hash__ = None
+    _fields = ()
+
+    def __repr__(self):
+        return '{0}({1})'.format(self.__class__.__name__, ', '.join(
+            '{0}={1!r}'.format(name, getattr(self, name))
+            for name in self._fields))
+
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and \
+            self._astuple() == other._astuple()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __iter__(self):
+        return iter(self._astuple())
+
+    def _astuple(self):
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def _asdict(self):
+        return dict((name, getattr(self, name)) for name in self._fields)
+
+
+def record_class(name, fields):
+    """ Create a `Record` subclass with `__slots__` for the field names.
+
+    Names have to be identifiers, which are not keywords and do not start
+    with an underscore.
+    """
+    fields = tuple(fields)
+    for field in fields:
+        if not IDENTIFIER.match(field) or keyword.iskeyword(field):
+            raise ValueError('Invalid field name: {0!r}.'.format(field))
+    if len(set(fields)) != len(fields):
+        raise ValueError('Duplicated field names.')
+    # Generated like in `collections.namedtuple`, to avoid looping over
+    # fields on every construction. Field names cannot start with an
+    # underscore, so they do not clash with `_self`.
+    source = 'def __init__(_self{0}):\n    pass\n{1}'.format(
+        ''.join(', ' + field for field in fields),
+        ''.join('    _self.{0} = {0}\n'.format(field) for field in fields))
+    namespace = {}
+    exec_(source, namespace)
+    return type(name, (Record, ), {
+        '__slots__': fields,
+        '_fields': fields,
+        '__init__': namespace['__init__'],
+    })
@@ -0,0 +1,113 @@
+import re
+import json
+from json.decoder import scanstring
+
+from six import binary_type
+
+
+# Numbers and literals accepted by `json.loads`, including its extensions.
+SCALAR_PATTERN = (r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?'
+                  r'|true|false|null|NaN|-?Infinity')
+# Chars of numbers, literals, separators and whitespace.
+ITEM_CHARS = r'[-+.,0-9eEtrufalsnNIiy \t\n\r]*'
+
+
+def _nested_array(depth):
+    """ Return a regexp matching arrays of numbers and literals, nested up
+    to `depth` levels. Only chars of the items are checked, not their syntax,
+    as matching every item is slower than decoding the array.
+    """
+    pattern = r'\[' + ITEM_CHARS + r'\]'
+    for _ in range(depth - 1):
+        # Unrolled, so a failed match does not backtrack exponentially.
+        pattern = (r'\[' + ITEM_CHARS + r'(?:' + pattern + ITEM_CHARS +
+                   r')*\]')
+    return re.compile(pattern)
+
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+NESTED_ARRAY = _nested_array(4)
+SCALAR = re.compile(SCALAR_PATTERN)
+
+decoder = json.JSONDecoder()
+
+
+def scan_object(buf, names):
+    """ Return a dict of the top level keys of a JSON object which are in
+    `names`.
+
+    Accepts `bytes`, `bytearray`, `memoryview` or text. Strings and arrays
+    of numbers and literals under other keys are skipped without decoding
+    them, other values are decoded by the C decoder and dropped. Invalid
+    JSON raises ValueError, except for two looser rules of skipped values,
+    kept as checking them is slower than decoding:
+
+    - strings without escapes are not checked for control chars;
+    - arrays of numbers and literals are checked for allowed chars and
+      brackets only, e.g. `[1,,2]` is skipped.
+    """
+    if isinstance(buf, memoryview):
+        buf = buf.tobytes()
+    if isinstance(buf, (binary_type, bytearray)):
+        buf = buf.decode('utf-8')
+
+    data = {}
+    idx = WHITESPACE.match(buf, 0).end()
+    if buf[idx:idx + 1] != '{':
+        raise ValueError('Expected JSON object at {0}.'.format(idx))
+    idx = WHITESPACE.match(buf, idx + 1).end()
+    if buf[idx:idx + 1] == '}':
+        idx += 1
+    else:
+        while True:
+            m = STRING.match(buf, idx)
+            if m is None:
+                raise ValueError('Expected object key at {0}.'.format(idx))
+            key = m.group()
+            key = json.loads(key) if '\\' in key else key[1:-1]
+            idx = WHITESPACE.match(buf, m.end()).end()
+            if buf[idx:idx + 1] != ':':
+                raise ValueError('Expected ":" at {0}.'.format(idx))
+            idx = WHITESPACE.match(buf, idx + 1).end()
+            if key in names:
+                data[key], idx = decoder.raw_decode(buf, idx)
+            else:
+                idx = skip_value(buf, idx)
+            idx = WHITESPACE.match(buf, idx).end()
+            char = buf[idx:idx + 1]
+            if char == '}':
+                idx += 1
+                break
+            elif char != ',':
+                raise ValueError('Expected "," or "}}" at {0}.'.format(idx))
+            idx = WHITESPACE.match(buf, idx + 1).end()
+    idx = WHITESPACE.match(buf, idx).end()
+    if idx != len(buf):
+        raise ValueError('Extra data at {0}.'.format(idx))
+    return data
+
+
+def skip_value(buf, idx):
+    """ Return the index of the end of a JSON value starting at `idx`.
+    """
+    char = buf[idx:idx + 1]
+    if char == '"':
+        # Most strings have no escapes, so their end is the next quote.
+        end = buf.find('"', idx + 1)
+        if end != -1 and buf.find('\\', idx + 1, end) == -1:
+            return end + 1
+        return scanstring(buf, idx + 1)[1]
+    elif char == '[' or char == '{':
+        if char == '[':
+            # Arrays of numbers and literals are skipped by one regexp.
+            m = NESTED_ARRAY.match(buf, idx)
+            if m is not None:
+                return m.end()
+        # Anything else is decoded by the C decoder, which is faster than
+        # looking for the end of the value in Python.
+        return decoder.raw_decode(buf, idx)[1]
+    m = SCALAR.match(buf, idx)
+    if m is None:
+        raise ValueError('Expected value at {0}.'.format(idx))
+    return m.end()
@@ -0,0 +1,322 @@
+import os
+import sys
+import stat
+import time
+import signal
+import base64
+import socket
+import argparse
+import importlib
+import threading
+import multiprocessing
+
+from six import iteritems, string_types
+from six.moves import socketserver, queue
+
+from yasv.protocol import (MAX_FRAME_SIZE, FrameTooLarge, pack_bitmap,
+                           send_frame, recv_frame, skip_frame)
+
+# Schemas of a worker process, set by `_init_worker`.
+_schemas = {}
+
+
+def load_schema(path):
+    """ Import a `Schema` subclass by 'package.module:Class' or
+    'package.module.Class' path.
+    """
+    module, sep, name = path.rpartition(':')
+    if not sep:
+        module, sep, name = path.rpartition('.')
+    if not module:
+        raise ValueError('Invalid schema path: {0}.'.format(path))
+    return getattr(importlib.import_module(module), name)
+
+
+def _init_worker(schemas):
+    _schemas.update(schemas)
+
+
+def _validate(args):
+    name, records = args
+    return _schemas[name].validate_many(records)
+
+
+class _Request(object):
+
+    def __init__(self, schema, records):
+        self.schema = schema
+        self.records = records
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server.validation_server
+        while True:
+            try:
+                message = recv_frame(self.rfile, server.max_frame_size)
+            except FrameTooLarge as e:
+                # The body is dropped without keeping it in memory, so the
+                # next frame can be read from the connection.
+                try:
+                    skip_frame(self.rfile, e.size)
+                except (EOFError, socket.error):
+                    return
+                response = {'error': str(e)}
+            except ValueError:
+                response = {'error': 'Invalid message.'}
+            except (EOFError, socket.error):
+                return
+            else:
+                if message is None:
+                    return
+                response = server.process(message)
+            try:
+                send_frame(self.request, response)
+            except socket.error:
+                return
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Server(object):
+    """ Server validating batches of records sent by `yasv.client.Client`.
+
+    `schemas` is a dict of name: `Schema` subclass or a list of import paths
+    of schema classes, which are used as names. `address` is a path of a Unix
+    socket or a (host, port) pair. Records are validated by a pool of
+    `workers` processes, or in the server process if `workers` is 0.
+
+    Requests which arrive while a batch is validated, or within
+    `batch_delay` seconds after the first one, are validated together, up to
+    `batch_size` records. Requests larger than `max_frame_size` bytes are
+    rejected.
+    """
+    def __init__(self, schemas, address, workers=None, batch_size=1000,
+                 batch_delay=0, max_frame_size=MAX_FRAME_SIZE):
+        if not isinstance(schemas, dict):
+            schemas = dict((path, path) for path in schemas)
+        self.schemas = {}
+        for name, schema in iteritems(schemas):
+            if isinstance(schema, string_types):
+                schema = load_schema(schema)
+            self.schemas[name] = schema
+        self.address = address
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_frame_size = max_frame_size
+        self._queue = queue.Queue()
+        self._pool = None
+        self._server = None
+        self._batcher = None
+        # Set while `serve_forever` runs and after `close`, guarded by
+        # `_lock`.
+        self._serving = False
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Bind the socket and start worker processes.
+        """
+        if self._server is not None:
+            return
+        self._closed = False
+        if self.workers:
+            self._pool = multiprocessing.Pool(
+                self.workers, _init_worker, (self.schemas,))
+        if isinstance(self.address, string_types):
+            if os.path.exists(self.address) and \
+                    stat.S_ISSOCK(os.stat(self.address).st_mode):
+                os.unlink(self.address)
+            self._server = _UnixServer(self.address, _Handler)
+        else:
+            self._server = _TCPServer(self.address, _Handler)
+        self._server.validation_server = self
+        self._batcher = threading.Thread(target=self._batch_loop)
+        self._batcher.daemon = True
+        self._batcher.start()
+
+    def serve_forever(self):
+        """ Handle requests until `close` is called. Returns at once if the
+        server was closed, e.g. by another thread, before.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self.start()
+            server = self._server
+            self._serving = True
+        server.serve_forever()
+
+    def close(self):
+        """ Stop handling requests, stop worker processes and remove the
+        socket file.
+        """
+        with self._lock:
+            if self._server is None:
+                return
+            server, serving = self._server, self._serving
+            self._server = None
+            self._serving = False
+            self._closed = True
+        # `shutdown` waits for the serve loop, so it would block forever if
+        # the loop was never started.
+        if serving:
+            server.shutdown()
+        server.server_close()
+        self._queue.put(None)
+        self._batcher.join()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+        if isinstance(self.address, string_types) and \
+                os.path.exists(self.address):
+            os.unlink(self.address)
+        self._pool = self._batcher = None
+
+    def process(self, message):
+        """ Validate a request message, return a response message.
+        """
+        try:
+            name = message['schema']
+            records = list(message['records'])
+        except (TypeError, KeyError):
+            return {'error': 'Expected "schema" and "records" keys.'}
+        if name not in self.schemas:
+            return {'error': 'Unknown schema: {0}.'.format(name)}
+        request = _Request(name, records)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            return {'error': request.error}
+        flags = [is_valid for is_valid, _ in request.results]
+        return {
+            'count': len(flags),
+            'valid': base64.b64encode(pack_bitmap(flags)).decode('ascii'),
+            'errors': dict((str(i), errors) for i, (_, errors)
+                           in enumerate(request.results) if errors),
+        }
+
+    def _batch_loop(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            size = len(request.records)
+            deadline = time.time() + self.batch_delay
+            while size < self.batch_size:
+                timeout = deadline - time.time()
+                try:
+                    if timeout > 0:
+                        request = self._queue.get(timeout=timeout)
+                    else:
+                        request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._run(batch)
+                    return
+                batch.append(request)
+                size += len(request.records)
+            self._run(batch)
+
+    def _run(self, batch):
+        groups = {}
+        for request in batch:
+            groups.setdefault(request.schema, []).append(request)
+        for name, requests in iteritems(groups):
+            records = [record for request in requests
+                       for record in request.records]
+            try:
+                results = self._validate(name, records)
+            except Exception:
+                # Validate requests one by one, so a failing record does
+                # not fail other requests of the batch.
+                for request in requests:
+                    try:
+                        request.results = self._validate(name,
+                                                         request.records)
+                    except Exception as e:
+                        request.error = '{0}: {1}'.format(type(e).__name__, e)
+                    request.done.set()
+                continue
+            start = 0
+            for request in requests:
+                end = start + len(request.records)
+                request.results = results[start:end]
+                request.done.set()
+                start = end
+
+    def _validate(self, name, records):
+        if self._pool is None:
+            return self.schemas[name].validate_many(records)
+        size = max(1, -(-len(records) // self.workers))
+        chunks = [(name, records[i:i + size])
+                  for i in range(0, len(records), size)]
+        return [result for results in self._pool.map(_validate, chunks)
+                for result in results]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='yasv')
+    commands = parser.add_subparsers(dest='command')
+    serve = commands.add_parser('serve', help='run a validation server')
+    serve.add_argument('schemas', nargs='+', metavar='SCHEMA',
+                       help='import path of a schema class, '
+                            'e.g. package.module:UserSchema')
+    serve.add_argument('--socket', help='path of a Unix socket')
+    serve.add_argument('--host', default='127.0.0.1',
+                       help='host of a TCP socket (default: %(default)s)')
+    serve.add_argument('--port', type=int, help='port of a TCP socket')
+    serve.add_argument('--workers', type=int,
+                       help='number of worker processes (default: number '
+                            'of CPUs, 0 to validate in the server process)')
+    serve.add_argument('--batch-size', type=int, default=1000,
+                       help='max number of records in a batch '
+                            '(default: %(default)s)')
+    serve.add_argument('--batch-delay', type=float, default=0,
+                       help='seconds to wait for more requests to a batch '
+                            '(default: %(default)s)')
+    serve.add_argument('--max-frame-size', type=int, default=MAX_FRAME_SIZE,
+                       help='max size of a request in bytes '
+                            '(default: %(default)s)')
+    args = parser.parse_args(argv)
+    if args.command != 'serve':
+        parser.print_help()
+        return 2
+    if args.socket:
+        address = args.socket
+    elif args.port is not None:
+        address = (args.host, args.port)
+    else:
+        serve.error('--socket or --port is required')
+
+    # Allow schemas from the current directory, like `python -m` does.
+    sys.path.insert(0, os.getcwd())
+    server = Server(args.schemas, address, workers=args.workers,
+                    batch_size=args.batch_size, batch_delay=args.batch_delay,
+                    max_frame_size=args.max_frame_size)
+    server.start()
+    # Set after worker processes are started, so they keep the default.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.close()
+    return 0
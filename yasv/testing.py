@@ -0,0 +1,272 @@
+""" Differential testing of the validation paths of yasv.
+
+Random schemas built of the bundled validators and random records are run
+through every engine, e.g. pooled instances, batches, JSON scanning or
+normalized `all_of` chains, and results are compared with the reference
+path of one `Schema` instance per record.
+"""
+import json
+import time
+import random
+
+from six import iteritems
+
+from yasv.core import Field, Schema
+from yasv.cache import ResultCache
+from yasv.validators import (Required, String, Length, InRange, IsIn, NotIn,
+                             IsURL, Int, Float, Decimal, DateTime, UUID,
+                             PatternSet, AllOf, AnyOf, Not, When)
+
+STRINGS = ['', 'a', 'abc', 'abcdef', 'http://example.com', 'example.com',
+           'DE123', 'de12', '42', '-7', '3.5', 'x y']
+NUMBERS = [0, 1, 5, 42, -7, 3.5, '0', '5', '42', '-7', '3.5', '1e3', 'x', '',
+           True, 'nan', 'inf', 'NaN']
+DATES = ['2014-01-02', '2014-01-02T03:04:05', '2014-01-02 03:04:05.5',
+         '02.01.2014', '2014-13-01', 'x', '', 5]
+UUIDS = ['12345678-1234-5678-1234-567812345678',
+         '{12345678-1234-5678-1234-567812345678}', '1234', 'x', '', 1]
+OTHERS = [None, [], {}, [1, 2]]
+PATTERNS = [('de', r'DE[0-9]{3}$'), ('digits', r'[0-9]+$'),
+            ('url', r'https?://'), ('word', r'[a-z]+$')]
+
+
+def _string_validators(rng):
+    validators = []
+    if rng.random() < 0.5:
+        validators.append(String())
+    choices = [
+        lambda: Length()(min=rng.randint(0, 3), max=rng.randint(3, 8)),
+        lambda: IsIn()(rng.sample(STRINGS, 4)),
+        lambda: NotIn()(rng.sample(STRINGS, 2)),
+        lambda: IsURL(),
+        lambda: PatternSet(rng.sample(PATTERNS, rng.randint(1, 4))),
+        lambda: AnyOf(IsIn()(rng.sample(STRINGS, 3)), IsURL()),
+        lambda: Not(IsIn()(rng.sample(STRINGS, 3))),
+        lambda: When(IsIn()(rng.sample(STRINGS, 4)),
+                     Length()(min=rng.randint(0, 3), max=rng.randint(3, 8))),
+        lambda: _when_callable(rng),
+    ]
+    for _ in range(rng.randint(0, 3)):
+        validators.append(rng.choice(choices)())
+    return validators
+
+
+def _when_callable(rng):
+    skipped = rng.sample(STRINGS, 4)
+    return When(lambda value, schema: value not in skipped, String(), IsURL())
+
+
+def _number_validators(rng):
+    validators = [rng.choice([Int, Float, Decimal])()]
+    if rng.random() < 0.7:
+        low = rng.randint(-10, 10)
+        validators.append(InRange()(min=low, max=low + rng.randint(1, 50)))
+    return validators
+
+
+def _date_validators(rng):
+    return [DateTime(format='%d.%m.%Y') if rng.random() < 0.3
+            else DateTime()]
+
+
+def _uuid_validators(rng):
+    return [UUID()]
+
+
+VALUES = {'string': STRINGS, 'number': NUMBERS, 'date': DATES,
+          'uuid': UUIDS}
+VALIDATORS = {'string': _string_validators, 'number': _number_validators,
+              'date': _date_validators, 'uuid': _uuid_validators}
+
+
+def random_schema(rng, name='RandomSchema'):
+    """ Return a random `Schema` subclass built of the bundled validators.
+    """
+    attrs = {}
+    for i in range(rng.randint(1, 6)):
+        validators = []
+        if rng.random() < 0.4:
+            validators.append(Required())
+        kind = rng.choice(sorted(VALIDATORS))
+        validators.extend(VALIDATORS[kind](rng))
+        field = Field('Field {0}'.format(i), *validators)
+        field.kind = kind
+        attrs['f{0}'.format(i)] = field
+    return type(name, (Schema, ), attrs)
+
+
+def random_records(schema, rng, count):
+    """ Return a list of random JSON serializable records for the schema.
+    """
+    records = []
+    for _ in range(count):
+        record = {}
+        for name, field in iteritems(schema._get_unbound_fields()):
+            if rng.random() < 0.15:
+                continue
+            values = VALUES[field.kind]
+            record[name] = rng.choice(values if rng.random() < 0.9
+                                      else OTHERS)
+        if rng.random() < 0.2:
+            record['unknown'] = {'nested': [rng.choice(STRINGS)]}
+        records.append(record)
+    return records
+
+
+def _outcome(schema):
+    return {
+        'is_valid': schema.is_valid,
+        'errors': schema.get_errors(),
+        'error_counts': dict((name, len(field.errors))
+                             for name, field in schema.items()),
+        'cleaned_data': dict((name, field.cleaned_data)
+                             for name, field in schema.items()),
+    }
+
+
+def reference(schema, records):
+    return [_outcome(schema(data)) for data in records]
+
+
+def rebind(schema, records):
+    outcomes = []
+    instance = None
+    for data in records:
+        if instance is None:
+            instance = schema(data)
+        else:
+            instance.rebind(data)
+        outcomes.append(_outcome(instance))
+    return outcomes
+
+
+def pooled(schema, records):
+    outcomes = []
+    for data in records:
+        instance = schema.acquire(data)
+        outcomes.append(_outcome(instance))
+        instance.release()
+    return outcomes
+
+
+def projected(schema, records):
+    names = list(schema._get_unbound_fields())
+    return [_outcome(schema(data, only=names)) for data in records]
+
+
+def from_json(schema, records):
+    return [_outcome(schema.from_json_bytes(json.dumps(data).encode('utf-8')))
+            for data in records]
+
+
+def normalized(schema, records):
+    attrs = {}
+    for name, field in iteritems(schema._get_unbound_fields()):
+        attrs[name] = Field(field.label, AllOf(*field.validators))
+    outcomes = reference(type(schema.__name__, (Schema, ), attrs), records)
+    # `AllOf` runs cheaper checks first, so an invalid value may be reported
+    # by another validator of the chain, with another message.
+    for outcome in outcomes:
+        del outcome['errors']
+    return outcomes
+
+
+def batch(schema, records):
+    return [{'is_valid': is_valid, 'errors': errors}
+            for is_valid, errors in schema.validate_many(records)]
+
+
+def cached(schema, records):
+    cache = ResultCache(':memory:')
+    try:
+        # The first run fills the cache, the second one reads it.
+        schema.validate_many(records, cache=cache)
+        return [{'is_valid': is_valid, 'errors': errors} for is_valid, errors
+                in schema.validate_many(records, cache=cache)]
+    finally:
+        cache.close()
+
+
+def records_output(schema, records):
+    cleaned, errors = schema.clean_many(records)
+    cleaned = iter(cleaned)
+    outcomes = []
+    for i in range(len(records)):
+        if i in errors:
+            outcomes.append({'is_valid': False, 'errors': errors[i]})
+        else:
+            outcomes.append({'is_valid': True, 'errors': {},
+                             'cleaned_data': next(cleaned)._asdict()})
+    return outcomes
+
+
+ENGINES = [
+    ('rebind', rebind),
+    ('pooled', pooled),
+    ('projected', projected),
+    ('from_json', from_json),
+    ('normalized', normalized),
+    ('batch', batch),
+    ('cached', cached),
+    ('records', records_output),
+]
+
+
+class Report(object):
+    """ Results of `run`: a list of mismatches and a dict of engine name:
+    total time in seconds, including the 'reference' path.
+    """
+    def __init__(self):
+        self.mismatches = []
+        self.timings = {}
+
+    def speedups(self):
+        """ Return a dict of engine name: reference time / engine time.
+        """
+        reference_time = self.timings['reference']
+        return dict((name, reference_time / elapsed if elapsed else 0.0)
+                    for name, elapsed in iteritems(self.timings))
+
+    def assert_equivalent(self):
+        if self.mismatches:
+            raise AssertionError('{0} mismatches, first: {1!r}'.format(
+                len(self.mismatches), self.mismatches[0]))
+
+
+def run(seed=0, schemas=20, records=50, engines=ENGINES):
+    """ Run random schemas and records through the engines, a list of
+    (name, function) pairs, and compare results with the reference path.
+
+    Each function accepts a `Schema` subclass and a list of records and
+    returns a list of dicts with 'is_valid', 'errors' and optionally
+    'cleaned_data' keys. Returns a `Report`.
+    """
+    rng = random.Random(seed)
+    report = Report()
+    report.timings = dict((name, 0.0) for name, _ in engines)
+    report.timings['reference'] = 0.0
+    for i in range(schemas):
+        schema = random_schema(rng, 'RandomSchema{0}'.format(i))
+        data = random_records(schema, rng, records)
+
+        start = time.time()
+        expected = reference(schema, data)
+        report.timings['reference'] += time.time() - start
+
+        for name, engine in engines:
+            start = time.time()
+            outcomes = engine(schema, data)
+            report.timings[name] += time.time() - start
+            for j, (outcome, reference_outcome) in enumerate(
+                    zip(outcomes, expected)):
+                for key, value in iteritems(outcome):
+                    if value != reference_outcome[key]:
+                        report.mismatches.append({
+                            'engine': name, 'schema': i, 'record': data[j],
+                            'key': key, 'expected': reference_outcome[key],
+                            'actual': value})
+            if len(outcomes) != len(expected):
+                report.mismatches.append({
+                    'engine': name, 'schema': i, 'key': 'length',
+                    'expected': len(expected), 'actual': len(outcomes)})
+    return report
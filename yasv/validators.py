@@ -1,24 +1,35 @@
 import re
 import sys
 import abc
+import math
+import uuid
+import decimal
+import datetime
 
-from six import with_metaclass, string_types, iteritems
+from six import with_metaclass, string_types, integer_types, iteritems
 
 from yasv.errors import ValidationError
 
 
 class Validator(object):
     """ Base abstract class for any validators.
+
+    Validators which replace the value in their checks have to set `opaque`,
+    so `AllOf` runs them as a whole instead of reordering their checks.
+    Validators which override `apply_rules` are always run as a whole.
     """
     templates = {}
+    opaque = False
 
     def __init__(self, *args, **kwargs):
         self._args = args
         self._kwargs = kwargs
+        self._context = {}
 
         for arg in args:
-            if isinstance(arg, basestring):
-                self.templates['default'] = arg
+            if isinstance(arg, string_types):
+                # Copied, so other instances keep the class templates.
+                self.templates = dict(self.templates, default=arg)
 
     def on_missing(self):
         return True
@@ -35,22 +46,38 @@ class Validator(object):
         return res
 
     def validate(self, field, fields):
-        self.value = field.cleaned_data
-        self.fields = fields
-        self.schema = fields
-        self.field = field
+        self._bind(field, fields, field.cleaned_data)
         if not self.apply_rules():
             raise ValidationError()
 
+    def _bind(self, field, fields, value):
+        self.value = value
+        self.fields = fields
+        self.schema = fields
+        self.field = field
 
     def context(self, *args, **kwargs):
         instance = self.__class__(*self._args, **self._kwargs)
+        instance._context = kwargs
         for name, arg in iteritems(kwargs):
             setattr(instance, name, arg)
         return instance
 
+    def clone(self):
+        """ Return a copy of the validator, with nested validators copied
+        too, so the copy keeps its own validation state.
+        """
+        args = [arg.clone() if isinstance(arg, Validator) else arg
+                for arg in self._args]
+        instance = self.__class__(*args, **self._kwargs)
+        instance._context = self._context
+        for name, arg in iteritems(self._context):
+            setattr(instance, name, arg)
+        return instance
+
     def message(self, key, *args):
-        self.field.add_error(self.templates.get(key, '').format(*args))
+        if not self.field._muted:
+            self.field.add_error(self.templates.get(key, '').format(*args))
 
 
 class Required(Validator):
@@ -151,6 +178,130 @@ class IsURL(RegexpValidator):
                 r'(:[0-9]+)?(\/.*)?$' % tld_part)
 
 
+def _literal_prefix(pattern):
+    """ Return a literal string every match of the pattern starts with.
+    """
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    depth = 0
+    escaped = in_class = False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and not depth:
+            # Alternatives may start with anything.
+            return ''
+    prefix = []
+    for char in pattern:
+        if char in '.^$*+?{}[]\\|()':
+            if char in '*+?{' and prefix:
+                # The last char is optional or repeated.
+                prefix.pop()
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+
+GLOBAL_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')
+
+
+class PatternSet(String):
+    """ Validates that the data matches one of many patterns.
+
+    Accepts a dict or a list of (name, pattern) pairs. Patterns are combined
+    into one regexp per first char of their literal prefixes, so the data is
+    matched in one pass. The name of the matched pattern is stored as
+    `matched` attribute of the field. Patterns must not contain
+    backreferences, and must not start with global inline flags like
+    `(?i)`, as those are only allowed at the start of the combined regexp.
+    Pass `flags` or use scoped flags like `(?i:...)` instead.
+    """
+    templates = {
+        'default': 'Value does not match any of allowed patterns.',
+        'wrong_type': 'Illegal type. String expected: {0}.',
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(PatternSet, self).__init__(*args, **kwargs)
+        patterns = args[0] if args else ()
+        if isinstance(patterns, dict):
+            patterns = list(iteritems(patterns))
+        self.flags = self._kwargs.get('flags', re.IGNORECASE)
+        self.names = [name for name, _ in patterns]
+
+        for _, pattern in patterns:
+            if GLOBAL_FLAGS.match(pattern):
+                raise ValueError('Patterns must not start with global inline '
+                                 'flags: {0}.'.format(pattern))
+
+        self._ignorecase = self.flags & re.IGNORECASE
+        buckets = {}
+        generic = []
+        for i, (_, pattern) in enumerate(patterns):
+            first = _literal_prefix(pattern)[:1]
+            if self._ignorecase:
+                # Some non-ASCII chars match ASCII ones when the case is
+                # ignored, so such patterns can be in any bucket.
+                first = first.lower() if first <= '\x7f' else ''
+            if first:
+                buckets.setdefault(first, []).append(i)
+            else:
+                generic.append(i)
+
+        sources = [pattern for _, pattern in patterns]
+        self._buckets = {}
+        for first, indexes in iteritems(buckets):
+            self._buckets[first] = self._compile(
+                sorted(indexes + generic), sources)
+        self._generic = self._compile(generic, sources)
+        if self._ignorecase:
+            self._all = self._compile(range(len(sources)), sources)
+
+    def _compile(self, indexes, sources):
+        if not indexes:
+            return None
+        return re.compile('|'.join('(?P<_{0}>{1})'.format(i, sources[i])
+                                   for i in indexes), self.flags)
+
+    def match(self, value):
+        """ Return the name of the first pattern matching the value, or None.
+        """
+        first = value[:1]
+        if self._ignorecase and first > '\x7f':
+            # Checked before lowering, as the lowercase of a non-ASCII char
+            # may start with an ASCII one, e.g. 'İ'.
+            regex = self._all
+        else:
+            if self._ignorecase:
+                first = first.lower()
+            regex = self._buckets.get(first, self._generic)
+        m = regex.match(value) if regex is not None else None
+        if m is None:
+            return None
+        return self.names[int(m.lastgroup[1:])]
+
+    def on_value(self):
+        if not self.value:
+            self.field.matched = None
+            return True
+        self.field.matched = self.match(self.value)
+        if self.field.matched is not None:
+            return True
+        else:
+            self.message('default')
+            return False
+
+
 class Length(HasLength):
     """ Validates that the length of data more than min length and
     less than max.
@@ -219,9 +370,365 @@ class InRange(Validator):
         return self.context(min=min, max=max)
 
 
+_invalid = object()
+
+
+class Coerce(Validator, with_metaclass(abc.ABCMeta)):
+    """ Base class for validators which parse the data into a typed value.
+
+    The parsed value is stored as cleaned data, so subsequent validators
+    of the field get it instead of the raw one. Pass `cache=<size>` to keep
+    up to `size` parsed strings.
+    """
+    types = ()
+    opaque = True
+
+    def __init__(self, *args, **kwargs):
+        super(Coerce, self).__init__(*args, **kwargs)
+        self.cache_size = self._kwargs.get('cache')
+        self._cache = {}
+
+    @abc.abstractmethod
+    def parse(self, value):
+        pass
+
+    def accepts(self, value):
+        """ Check the parsed value, e.g. that it is finite.
+        """
+        return True
+
+    def specified_type(self):
+        value = self.value
+        if isinstance(value, self.types) and not isinstance(value, bool):
+            parsed = value
+        elif self.cache_size and isinstance(value, string_types):
+            parsed = self._cache.get(value)
+            if parsed is None:
+                parsed = self._parse(value)
+                if len(self._cache) >= self.cache_size:
+                    self._cache.clear()
+                self._cache[value] = parsed
+        else:
+            parsed = self._parse(value)
+        if parsed is _invalid or not self.accepts(parsed):
+            self.message('wrong_type', value)
+            return False
+        self.value = parsed
+        return True
+
+    def _parse(self, value):
+        try:
+            return self.parse(value)
+        except (TypeError, ValueError, ArithmeticError):
+            return _invalid
+
+
+class Int(Coerce):
+    """ Parses the data as an integer.
+    """
+    templates = {'wrong_type': 'Illegal value. Integer expected: {0}.'}
+    types = integer_types
+
+    def parse(self, value):
+        if isinstance(value, string_types):
+            return int(value)
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        raise TypeError()
+
+
+class Float(Coerce):
+    """ Parses the data as a float. NaN and infinity are rejected unless
+    `finite=False` is given.
+    """
+    templates = {'wrong_type': 'Illegal value. Float expected: {0}.'}
+    types = float
+
+    def parse(self, value):
+        if isinstance(value, string_types + integer_types) and \
+                not isinstance(value, bool):
+            return float(value)
+        raise TypeError()
+
+    def accepts(self, value):
+        return (not self._kwargs.get('finite', True) or
+                not (math.isinf(value) or math.isnan(value)))
+
+
+class Decimal(Coerce):
+    """ Parses the data as a `decimal.Decimal`. NaN and infinity are rejected
+    unless `finite=False` is given.
+    """
+    templates = {'wrong_type': 'Illegal value. Decimal expected: {0}.'}
+    types = decimal.Decimal
+
+    def parse(self, value):
+        if isinstance(value, float):
+            return decimal.Decimal(repr(value))
+        if isinstance(value, string_types + integer_types) and \
+                not isinstance(value, bool):
+            return decimal.Decimal(value)
+        raise TypeError()
+
+    def accepts(self, value):
+        return not self._kwargs.get('finite', True) or value.is_finite()
+
+
+class DateTime(Coerce):
+    """ Parses the data as a `datetime.datetime`.
+
+    Strings are parsed as ISO 8601 or with `format` if it is given.
+    """
+    templates = {'wrong_type': 'Illegal value. Datetime expected: {0}.'}
+    types = datetime.datetime
+    iso_formats = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S',
+                   '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+    def parse(self, value):
+        if not isinstance(value, string_types):
+            raise TypeError()
+        format = self._kwargs.get('format')
+        if format:
+            return datetime.datetime.strptime(value, format)
+        if hasattr(datetime.datetime, 'fromisoformat'):
+            return datetime.datetime.fromisoformat(value)
+        for format in self.iso_formats:
+            try:
+                return datetime.datetime.strptime(value, format)
+            except ValueError:
+                pass
+        raise ValueError()
+
+
+class UUID(Coerce):
+    """ Parses the data as a `uuid.UUID`.
+    """
+    templates = {'wrong_type': 'Illegal value. UUID expected: {0}.'}
+    types = uuid.UUID
+
+    def parse(self, value):
+        if isinstance(value, string_types):
+            return uuid.UUID(value)
+        raise TypeError()
+
+
+def _same(a, b):
+    """ Check that two validators do the same checks.
+    """
+    return a is b or (a.__class__ is b.__class__ and a._args == b._args and
+                      a._kwargs == b._kwargs and a._context == b._context)
+
+
+def _is_opaque(validator):
+    """ Check that the validator cannot be split into separate checks.
+    """
+    return (validator.opaque or
+            validator.__class__.apply_rules != Validator.apply_rules)
+
+
+def _checks(validators, method):
+    """ Return a list of (validator, check) pairs for the non-trivial
+    `method` checks of validators. Checks implemented by the same function
+    with the same parameters are run only once.
+    """
+    checks = []
+    # Parameters may be unhashable, so they are compared one by one.
+    seen = []
+    for validator in validators:
+        func = getattr(validator.__class__, method)
+        if func == getattr(Validator, method):
+            continue
+        key = (func, validator._args, validator._kwargs, validator._context)
+        if key not in seen:
+            seen.append(key)
+            checks.append((validator, getattr(validator, method)))
+    return checks
+
+
+class AllOf(Validator):
+    """ Validates that the data passes all of the validators.
+
+    The chain is normalized on construction: duplicated validators are
+    dropped, presence and type checks shared by several validators run only
+    once, and all presence checks run before type checks, which run before
+    value checks. Presence and type checks must depend on the value only.
+    If a check fails without reporting an error, the validators are run in
+    their order, so errors are reported like by a plain chain.
+    """
+    opaque = True
+
+    def __init__(self, *args, **kwargs):
+        super(AllOf, self).__init__(*args, **kwargs)
+        self.validators = []
+        for arg in args:
+            if isinstance(arg, AllOf):
+                children = arg.validators
+            elif isinstance(arg, Validator):
+                children = [arg]
+            else:
+                continue
+            for child in children:
+                if not any(_same(child, v) for v in self.validators):
+                    self.validators.append(child)
+
+        # The plan is a list of steps. A step is either an opaque validator,
+        # which is run as a whole, or a list of checks of a run of plain
+        # validators, ordered from cheaper to more expensive.
+        self._plan = []
+        run = []
+        for validator in self.validators + [None]:
+            if validator is None or _is_opaque(validator):
+                if run:
+                    self._plan.append((run, _checks(run, 'on_missing') +
+                                       _checks(run, 'specified_type') +
+                                       [(v, v.on_value) for v in run]))
+                    run = []
+                if validator is not None:
+                    self._plan.append(([validator], None))
+            else:
+                run.append(validator)
+
+    def apply_rules(self):
+        for validators, checks in self._plan:
+            for validator in validators:
+                validator._bind(self.field, self.fields, self.value)
+            if checks is None:
+                if not validators[0].apply_rules():
+                    return False
+                self.value = self.field._cleaned_data
+                continue
+            value = self.value
+            errors = len(self.field.errors)
+            for validator, check in checks:
+                if not check():
+                    if not self.field._muted and \
+                            len(self.field.errors) == errors:
+                        # The check failed silently, while a validator
+                        # preceding it in the chain may report an error.
+                        return self._apply_in_order(validators, value)
+                    self.field._cleaned_data = validator.value
+                    return False
+                if validator.value is not self.value:
+                    # The check replaced the value, pass it further.
+                    self.value = validator.value
+                    for v in validators:
+                        v.value = self.value
+        self.field._cleaned_data = self.value
+        return True
+
+    def _apply_in_order(self, validators, value):
+        for validator in validators:
+            validator._bind(self.field, self.fields, value)
+            if not validator.apply_rules():
+                return False
+            value = self.field._cleaned_data
+        return True
+
+    def __call__(self, *validators):
+        return self.__class__(*validators)
+
+
+class AnyOf(Validator):
+    """ Validates that the data passes at least one of the validators.
+
+    Validators are tried in order until the first success. If all of them
+    fail, only errors of the last one are reported.
+    """
+    opaque = True
+
+    def __init__(self, *args, **kwargs):
+        super(AnyOf, self).__init__(*args, **kwargs)
+        self.validators = [arg for arg in args if isinstance(arg, Validator)]
+
+    def apply_rules(self):
+        last = len(self.validators) - 1
+        for i, validator in enumerate(self.validators):
+            validator._bind(self.field, self.fields, self.value)
+            if i < last:
+                self.field._muted += 1
+            try:
+                if validator.apply_rules():
+                    return True
+            finally:
+                if i < last:
+                    self.field._muted -= 1
+            self.field._cleaned_data = self.value
+        return not self.validators
+
+    def __call__(self, *validators):
+        return self.__class__(*validators)
+
+
+class Not(Validator):
+    """ Validates that the data does not pass the validator.
+    """
+    templates = {'default': 'Value is not allowed.'}
+
+    def __init__(self, *args, **kwargs):
+        super(Not, self).__init__(*args, **kwargs)
+        validators = [arg for arg in args if isinstance(arg, Validator)]
+        self.validator = validators[0] if validators else None
+
+    def on_value(self):
+        if self.validator is None or not _passes(self.validator, self):
+            return True
+        else:
+            self.message('default')
+            return False
+
+    def __call__(self, validator):
+        return self.__class__(validator)
+
+
+class When(Validator):
+    """ Validates the data with validators only if condition is met.
+
+    Condition is either a validator, which is checked silently, or a callable
+    which accepts the value and the schema.
+    """
+    opaque = True
+
+    def __init__(self, *args, **kwargs):
+        super(When, self).__init__(*args, **kwargs)
+        self.condition = args[0] if args else None
+        self.validator = AllOf(*args[1:])
+
+    def apply_rules(self):
+        if isinstance(self.condition, Validator):
+            matched = _passes(self.condition, self)
+        else:
+            matched = self.condition is None or self.condition(self.value,
+                                                               self.schema)
+        if not matched:
+            return True
+        self.validator._bind(self.field, self.fields, self.value)
+        return self.validator.apply_rules()
+
+    def __call__(self, condition, *validators):
+        return self.__class__(condition, *validators)
+
+
+def _passes(validator, parent):
+    """ Check the value of `parent` with the validator without reporting
+    errors and changing the cleaned data.
+    """
+    field = parent.field
+    validator._bind(field, parent.fields, parent.value)
+    field._muted += 1
+    try:
+        return validator.apply_rules()
+    finally:
+        field._muted -= 1
+        field._cleaned_data = parent.value
+
+
 required = Required()
 is_in = IsIn()
 not_in = NotIn()
 is_url = IsURL()
 length = Length()
 in_range = InRange()
+all_of = AllOf()
+any_of = AnyOf()
+not_ = Not()
+when = When()